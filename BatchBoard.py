@@ -0,0 +1,228 @@
+import numpy as np
+from GameBoard import GRID_SIZE, PLAYER_ACTIONS
+from GameAgent import print_results
+from RowTables import row_tables, ROW_COUNT
+
+# action indexes, in PLAYER_ACTIONS order
+UP, DOWN, LEFT, RIGHT = [PLAYER_ACTIONS.index(action) for action in ('up', 'down', 'left', 'right')]
+NIBBLE_SHIFTS = np.arange(GRID_SIZE, dtype=np.uint16) * 4
+ROW_SHIFTS = np.arange(GRID_SIZE, dtype=np.uint64) * np.uint64(16)
+CORNER_SHIFTS = np.array([0, 12, 48, 60], dtype=np.uint64)
+
+_tables = None
+
+def numpy_tables() -> dict:
+    """
+    Returns the row tables as NumPy arrays indexed by packed row, plus
+        whether each row changes on a left or right shift.
+    """
+    global _tables
+    if _tables is None:
+        tables = {}
+        for name in ('left', 'right', 'left_score', 'right_score', 'smoothness', 'blanks', 'max_exponent'):
+            table = getattr(row_tables, name)
+            if isinstance(table, memoryview):
+                tables[name] = np.frombuffer(table, dtype=table.format)
+            else: # lazily built tables
+                tables[name] = np.array([table[row] for row in range(ROW_COUNT)])
+        rows = np.arange(ROW_COUNT)
+        # bit per action that changes the board when this row is a row (left/right) or column (up/down)
+        tables['row_moves'] = ((tables['left'] != rows) << LEFT | (tables['right'] != rows) << RIGHT).astype(np.uint8)
+        tables['col_moves'] = ((tables['left'] != rows) << UP | (tables['right'] != rows) << DOWN).astype(np.uint8)
+        _tables = tables
+    return _tables
+
+def packed_rows(boards):
+    """
+    Returns the rows of an array of packed boards (uint64) as an (N, 4) array of table indexes.
+    """
+    return ((boards[:, None] >> ROW_SHIFTS) & np.uint64(0xFFFF)).astype(np.intp)
+
+def transpose_packed(boards):
+    """
+    Symmetry.transpose for an array of packed boards.
+    """
+    a1 = boards & np.uint64(0xF0F00F0FF0F00F0F)
+    a2 = boards & np.uint64(0x0000F0F00000F0F0)
+    a3 = boards & np.uint64(0x0F0F00000F0F0000)
+    a = a1 | (a2 << np.uint64(12)) | (a3 >> np.uint64(12))
+    b1 = a & np.uint64(0xFF00FF0000FF00FF)
+    b2 = a & np.uint64(0x00FF00FF00000000)
+    b3 = a & np.uint64(0x00000000FF00FF00)
+    return b1 | (b2 >> np.uint64(24)) | (b3 << np.uint64(24))
+
+def packed_has_moves(rows, cols):
+    """
+    Returns whether each board can move, from its packed_rows and those of its transpose.
+    """
+    tables = numpy_tables()
+    row_moves = tables['row_moves'][rows]
+    col_moves = tables['col_moves'][cols]
+    return (row_moves | col_moves).any(axis=1)
+
+def packed_highest_tiles(rows):
+    """
+    BitBoard.highest_tile for packed boards given as packed_rows.
+    """
+    exponents = numpy_tables()['max_exponent'][rows].max(axis=1).astype(np.int64)
+    return np.where(exponents > 0, np.int64(1) << exponents, 0)
+
+def packed_best_corners(boards):
+    """
+    BitBoard.best_corner for an array of packed boards.
+    """
+    exponents = ((boards[:, None] >> CORNER_SHIFTS) & np.uint64(0xF)).max(axis=1).astype(np.int64)
+    return np.where(exponents > 0, np.int64(1) << exponents, -1)
+
+class BatchBoard():
+    """
+    Many 2048 boards played in lockstep. Boards are stored as an (N, 4, 4)
+        array of log2 exponents (0 for a blank cell) and moved with
+        vectorized row-table lookups. Actions are indexes into PLAYER_ACTIONS.
+    """
+    def __init__(self, num_boards, seed = None) -> None:
+        self.rng = np.random.default_rng(seed)
+        self.exponents = np.zeros((num_boards, GRID_SIZE, GRID_SIZE), dtype=np.uint8)
+        self.scores = np.zeros(num_boards, dtype=np.int64)
+        self.done = np.zeros(num_boards, dtype=bool)
+        self.reset()
+
+    def __len__(self):
+        return len(self.exponents)
+
+    def reset(self, mask = None) -> None:
+        """
+        Clears the selected boards (all by default) and adds two random tiles to each.
+        """
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        self.exponents[mask] = 0
+        self.scores[mask] = 0
+        self.done[mask] = False
+        self.add_random_tiles(mask)
+        self.add_random_tiles(mask)
+
+    def add_random_tiles(self, mask) -> None:
+        """
+        Adds a random tile to a blank space on each selected board.
+        """
+        boards = np.flatnonzero(mask)
+        cells = self.exponents[boards].reshape(len(boards), GRID_SIZE * GRID_SIZE)
+        # the blank cell with the highest random key is a uniform choice among blanks
+        keys = self.rng.random(cells.shape)
+        keys[cells != 0] = -1
+        selected = keys.argmax(axis=1)
+        tiles = np.where(self.rng.random(len(boards)) < 0.9, 1, 2)
+        self.exponents.reshape(len(self), -1)[boards, selected] = tiles
+
+    def rows(self):
+        """
+        Returns the packed rows, and the packed columns read from the top, as (N, 4) arrays.
+        """
+        exponents = self.exponents.astype(np.uint16)
+        rows = exponents[:, :, 0] | exponents[:, :, 1] << 4 | exponents[:, :, 2] << 8 | exponents[:, :, 3] << 12
+        cols = exponents[:, 0, :] | exponents[:, 1, :] << 4 | exponents[:, 2, :] << 8 | exponents[:, 3, :] << 12
+        return rows, cols
+
+    def legal_moves(self, rows = None, cols = None):
+        """
+        Returns an (N, 4) mask of which actions would change each board.
+        """
+        if rows is None:
+            rows, cols = self.rows()
+        tables = numpy_tables()
+        row_moves = tables['row_moves'][rows]
+        col_moves = tables['col_moves'][cols]
+        moves = (row_moves[:, 0] | row_moves[:, 1] | row_moves[:, 2] | row_moves[:, 3]
+            | col_moves[:, 0] | col_moves[:, 1] | col_moves[:, 2] | col_moves[:, 3])
+        return (moves[:, None] >> np.arange(len(PLAYER_ACTIONS), dtype=np.uint8) & 1).astype(bool)
+
+    def step(self, actions):
+        """
+        Applies one action to every board that is not done, adding a random tile
+            to each board that changed. Returns the score gained by each board,
+            the mask of finished boards and the (N, 4) legal move mask.
+        """
+        tables = numpy_tables()
+        actions = np.asarray(actions)
+        rows, cols = self.rows()
+        vertical = (actions == UP) | (actions == DOWN)
+        towards_start = (actions == UP) | (actions == LEFT)
+        lines = np.where(vertical[:, None], cols, rows)
+        new_lines = np.where(towards_start[:, None], tables['left'][lines], tables['right'][lines])
+        rewards = np.where(towards_start[:, None], tables['left_score'][lines], tables['right_score'][lines]).sum(axis=1, dtype=np.int64)
+        differs = new_lines != lines
+        changed = (differs[:, 0] | differs[:, 1] | differs[:, 2] | differs[:, 3]) & ~self.done
+        rewards[~changed] = 0
+
+        cells = ((new_lines[:, :, None] >> NIBBLE_SHIFTS) & 0xF).astype(np.uint8)
+        cells = np.where(vertical[:, None, None], cells.transpose(0, 2, 1), cells)
+        self.exponents[changed] = cells[changed]
+        self.scores += rewards
+        self.add_random_tiles(changed)
+
+        legal = self.legal_moves()
+        self.done |= ~legal.any(axis=1)
+        return rewards, self.done.copy(), legal
+
+    def highest_tiles(self):
+        return 1 << self.exponents.reshape(len(self), -1).max(axis=1).astype(np.int64)
+
+def random_policy(batch, legal):
+    """
+    Picks a uniformly random legal action on each board.
+    """
+    keys = batch.rng.random(legal.shape)
+    keys[~legal] = -1
+    return keys.argmax(axis=1)
+
+def single_direction_policy(batch, legal):
+    """
+    Moves down when possible, otherwise randomly, like SingleDirectionAgent.
+    """
+    return np.where(legal[:, DOWN], DOWN, random_policy(batch, legal))
+
+class LeftDownPolicy():
+    """
+    Vectorized LeftDownAgent: alternates left and down, falling back to up and then right.
+    """
+    def __init__(self) -> None:
+        self.left = None
+
+    def __call__(self, batch, legal):
+        if self.left is None or len(self.left) != len(batch):
+            self.left = np.ones(len(batch), dtype=bool)
+        actions = np.full(len(batch), RIGHT)
+        chosen = np.zeros(len(batch), dtype=bool)
+        left = self.left
+
+        try_left = left & legal[:, LEFT]
+        actions[try_left] = LEFT
+        chosen |= try_left
+        left = np.zeros(len(batch), dtype=bool) # the flag always clears after trying left first
+        for action, new_flag in ((DOWN, True), (LEFT, None), (UP, False)):
+            pick = ~chosen & legal[:, action]
+            actions[pick] = action
+            if new_flag is not None:
+                left = np.where(pick, new_flag, left)
+            chosen |= pick
+        left = np.where(chosen, left, True)
+        self.left = left
+        return actions
+
+def play_batch(policy, num_games = 1000, seed = None, mute = False):
+    """
+    Plays num_games games in lockstep with a vectorized policy, called as
+        policy(batch, legal) and returning one action per board.
+        Prints the same summary as play_n_times and returns scores and highest tiles.
+    """
+    batch = BatchBoard(num_games, seed)
+    legal = batch.legal_moves()
+    batch.done = ~legal.any(axis=1)
+    while not batch.done.all():
+        rewards, done, legal = batch.step(policy(batch, legal))
+    scores = batch.scores.tolist()
+    highestTiles = batch.highest_tiles().tolist()
+    if not mute:
+        print_results(scores, highestTiles)
+    return (scores, highestTiles)
@@ -0,0 +1,231 @@
+"""
+Benchmarks for the board engine and the agents, run on boards sampled from
+seeded random games so every run measures the same positions. Results are
+printed and can be written as JSON and compared against a baseline run:
+
+    python3 Benchmark.py --output baseline.json
+    python3 Benchmark.py --baseline baseline.json
+
+A benchmark whose rate drops by more than the threshold is reported as a
+regression and makes the run exit with status 1.
+"""
+import argparse
+import hashlib
+import json
+import platform
+import random
+import sys
+from time import perf_counter
+from GameBoard import GameBoard, PLAYER_ACTIONS
+from BitBoard import BitBoard
+from RowTables import TABLE_VERSION
+
+BOARDS = {'list': GameBoard, 'bit': BitBoard}
+GROUPS = ('engine', 'search', 'learning')
+SEARCH_AGENTS = ('ExpectimaxAgent', 'CornersExpectimaxAgent', 'SmoothEmptyCornersExpectimaxAgent')
+LEARNING_AGENTS = {
+    'QLearningAgent': {'learning_rate': 0.1, 'discount': 0.9, 'epsilon': 0.1},
+    'ApproximateQLearningAgent': {'learning_rate': 0.0001, 'discount': 0.9, 'epsilon': 0.9},
+    'NTupleQLearningAgent': {},
+}
+
+def board_corpus(seed, size, every = 7):
+    """
+    Returns size GameBoards sampled every few moves from random games played
+        with the given seed. The same seed always gives the same boards.
+    """
+    random.seed(seed)
+    boards = []
+    while len(boards) < size:
+        board = GameBoard()
+        moves = 0
+        while board.has_moves() and len(boards) < size:
+            if moves % every == 0:
+                boards.append(board.copy())
+            if board.make_move(random.choice(board.get_legal_moves())):
+                board.add_random_tile()
+            moves += 1
+    return boards
+
+def corpus_digest(boards) -> str:
+    return hashlib.sha1(b''.join(board.pack().to_bytes(8, 'little') for board in boards)).hexdigest()[:12]
+
+def best_time(run, repeat):
+    """
+    Returns the fastest of repeat runs in seconds, with the value run returned.
+    """
+    best = None
+    for i in range(repeat):
+        start = perf_counter()
+        result = run()
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def engine_benchmarks(boards, repeat):
+    """
+    Yields (name, unit, operations, seconds) for the board operations on each backend.
+    """
+    for backend, board_class in BOARDS.items():
+        corpus = boards if board_class is GameBoard else [board_class.from_board(board) for board in boards]
+        for action in PLAYER_ACTIONS:
+            def run():
+                copies = [board.copy() for board in corpus]
+                start = perf_counter()
+                for board in copies:
+                    board.make_move(action)
+                return perf_counter() - start
+            # copying is timed separately, so only the moves count here
+            seconds = min(run() for i in range(repeat))
+            yield (f"{backend}.{action}", 'moves/s', len(corpus), seconds)
+        for name, operation in (('copy', board_class.copy), ('get_legal_moves', board_class.get_legal_moves), ('has_moves', board_class.has_moves)):
+            seconds, result = best_time(lambda: [operation(board) for board in corpus], repeat)
+            yield (f"{backend}.{name}", 'calls/s', len(corpus), seconds)
+
+def counting_agent(agent_class):
+    """
+    Returns a subclass of an expectimax agent class that counts the states it
+        values in its nodes attribute, leaving the agent itself uninstrumented.
+    """
+    class CountingAgent(agent_class):
+        nodes = 0
+
+        def value(self, *args, **kwargs):
+            self.nodes += 1
+            return super().value(*args, **kwargs)
+
+        def bounded_value(self, *args, **kwargs):
+            self.nodes += 1
+            return super().bounded_value(*args, **kwargs)
+
+        def expand(self, *args, **kwargs):
+            self.nodes += 1
+            return super().expand(*args, **kwargs)
+
+    CountingAgent.__name__ = CountingAgent.__qualname__ = agent_class.__name__
+    return CountingAgent
+
+def search_benchmarks(boards, depths, repeat):
+    """
+    Yields expectimax nodes per second for each agent and depth, choosing a move on each board.
+    """
+    import ExpectimaxAgent
+    corpus = [BitBoard.from_board(board) for board in boards]
+    for name in SEARCH_AGENTS:
+        for depth in depths:
+            agent = counting_agent(getattr(ExpectimaxAgent, name))(depth)
+            def run():
+                agent.nodes = 0
+                for board in corpus:
+                    agent.get_move(board)
+                return agent.nodes
+            seconds, nodes = best_time(run, repeat)
+            yield (f"{name}.depth{depth}", 'nodes/s', nodes, seconds)
+
+def learning_benchmarks(seed, episodes, repeat):
+    """
+    Yields Q-learning training steps per second for each learning agent, over seeded episodes.
+    """
+    import QLearningAgent
+    for name, params in LEARNING_AGENTS.items():
+        def run():
+            agent = getattr(QLearningAgent, name)(**params)
+            steps = 0
+            get_action = agent.get_action
+            def counted_action(board):
+                nonlocal steps
+                steps += 1
+                return get_action(board)
+            agent.get_action = counted_action
+            random.seed(seed)
+            for i in range(episodes):
+                agent.train()
+            return steps
+        seconds, steps = best_time(run, repeat)
+        yield (f"{name}.train", 'steps/s', steps, seconds)
+
+def run_benchmarks(seed = 2048, corpus_size = 2000, search_boards = 5, depths = (2, 3, 4, 5), episodes = 20, repeat = 3, groups = GROUPS):
+    """
+    Runs the selected benchmark groups and returns the results as a JSON-ready dict.
+    """
+    boards = board_corpus(seed, corpus_size)
+    results = {}
+    def record(name, unit, operations, seconds):
+        results[name] = {'unit': unit, 'operations': operations, 'seconds': seconds, 'rate': operations / seconds}
+        print(f"{name:45} {operations / seconds:14,.0f} {unit}", flush=True)
+    if 'engine' in groups:
+        for result in engine_benchmarks(boards, repeat):
+            record(*result)
+    if 'search' in groups:
+        for result in search_benchmarks(boards[::max(1, len(boards) // search_boards)][:search_boards], depths, repeat):
+            record(*result)
+    if 'learning' in groups:
+        for result in learning_benchmarks(seed, episodes, repeat):
+            record(*result)
+    return {
+        'meta': {
+            'seed': seed,
+            'corpus_size': corpus_size,
+            'corpus': corpus_digest(boards),
+            'search_boards': search_boards,
+            'episodes': episodes,
+            'repeat': repeat,
+            'table_version': TABLE_VERSION,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+def compare(report, baseline, threshold = 0.1):
+    """
+    Prints each benchmark's change against the baseline and returns the names
+        of those whose rate fell by more than threshold (a fraction).
+    """
+    if report['meta']['corpus'] != baseline['meta']['corpus']:
+        print("Warning: the baseline was run on a different board corpus")
+    regressions = []
+    for name, result in report['results'].items():
+        if name not in baseline['results']:
+            continue
+        change = result['rate'] / baseline['results'][name]['rate'] - 1
+        flag = ''
+        if change < -threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:45} {change:+8.1%}{flag}")
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Benchmark the 2048 engine and agents.")
+    parser.add_argument('groups', nargs='*', metavar='GROUP', help="benchmark groups to run: engine, search and/or learning (default: all)")
+    parser.add_argument('--seed', type=int, default=2048, help="seed for the board corpus and training episodes")
+    parser.add_argument('--corpus-size', type=int, default=2000, help="boards in the engine corpus")
+    parser.add_argument('--search-boards', type=int, default=5, help="corpus boards to choose a move on per search benchmark")
+    parser.add_argument('--depths', type=int, nargs='+', default=[2, 3, 4, 5], help="expectimax depths")
+    parser.add_argument('--episodes', type=int, default=20, help="training episodes per learning benchmark")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark, keeping the fastest")
+    parser.add_argument('--output', help="file to write the JSON results to")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="rate drop counted as a regression (default: 0.1)")
+    args = parser.parse_args(argv)
+    for group in args.groups:
+        if group not in GROUPS:
+            parser.error(f"unknown benchmark group {group!r}")
+    report = run_benchmarks(args.seed, args.corpus_size, args.search_boards, args.depths, args.episodes, args.repeat,
+        args.groups or GROUPS)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(len(regressions), "regression(s):", ', '.join(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
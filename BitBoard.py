@@ -0,0 +1,221 @@
+import random
+from GameBoard import GameBoard, GRID_SIZE, BASE_NUMBER, PLAYER_ACTIONS
+from RowTables import row_tables
+from Symmetry import transpose
+from PerfTimer import perf_timer
+
+ROW_MASK = 0xFFFF
+CELL_MASK = 0xF
+
+def shift_rows(board, row_table, score_table) -> tuple[int, int]:
+    """
+    Applies a row shift table to every row of a packed board.
+        Returns the new packed board and the score gained.
+    """
+    row0 = board & ROW_MASK
+    row1 = (board >> 16) & ROW_MASK
+    row2 = (board >> 32) & ROW_MASK
+    row3 = board >> 48
+    new_board = (row_table[row0] | (row_table[row1] << 16)
+        | (row_table[row2] << 32) | (row_table[row3] << 48))
+    score_add = score_table[row0] + score_table[row1] + score_table[row2] + score_table[row3]
+    return new_board, score_add
+
+class BitBoard(GameBoard):
+    """
+    GameBoard backed by a single 64-bit integer of 4-bit log2 exponents
+        (0 for a blank cell), so copying and hashing are trivial.
+        Tiles are limited to 2**15.
+    """
+    def __init__(self, add_tiles = True) -> None:
+        self.score = 0
+        self.board = 0
+
+        # add two numbers to random spots on grid
+        if add_tiles:
+            self.add_random_tile()
+            self.add_random_tile()
+
+    @classmethod
+    def from_packed(cls, packed, score = 0):
+        new_board = cls(False)
+        new_board.board = packed
+        new_board.score = score
+        return new_board
+
+    @classmethod
+    def from_board(cls, board):
+        """
+        Returns a BitBoard holding the same tiles and score as the given board.
+        """
+        return cls.from_packed(board.pack(), board.score)
+
+    @property
+    def spaces(self):
+        """
+        List-of-lists view of the board, matching GameBoard.spaces. Changes to it are not written back.
+        """
+        spaces = [[None] * GRID_SIZE for i in range(GRID_SIZE)]
+        for i in range(GRID_SIZE):
+            for j in range(GRID_SIZE):
+                exponent = (self.board >> (4 * (GRID_SIZE * i + j))) & CELL_MASK
+                if exponent:
+                    spaces[i][j] = 1 << exponent
+        return spaces
+
+    @perf_timer.counted('board.copies')
+    def copy(self):
+        new_board = BitBoard.__new__(BitBoard)
+        new_board.board = self.board
+        new_board.score = self.score
+        return new_board
+
+    def hash_board(self):
+        return self.board
+
+    def pack(self) -> int:
+        return self.board
+
+    def set_tile(self, row, col, value) -> None:
+        shift = 4 * (GRID_SIZE * row + col)
+        exponent = 0 if value is None else value.bit_length() - 1
+        self.board = (self.board & ~(CELL_MASK << shift)) | (exponent << shift)
+
+    def get_blank_spaces(self):
+        blank_spaces = []
+        board = self.board
+        for cell in range(GRID_SIZE * GRID_SIZE):
+            if not (board >> (4 * cell)) & CELL_MASK:
+                blank_spaces.append(divmod(cell, GRID_SIZE))
+        return blank_spaces
+
+    def add_random_tile(self) -> tuple[int, int, int]:
+        """
+        Adds a random tile to a blank space on the board.
+        Returns the row, column and value of the new tile.
+        """
+        selected_space = random.choice(self.get_blank_spaces())
+        tile = random.choices([BASE_NUMBER, BASE_NUMBER * 2], weights=[0.9, 0.1])[0]
+        self.board |= (tile.bit_length() - 1) << (4 * (GRID_SIZE * selected_space[0] + selected_space[1]))
+        return (*selected_space, tile)
+
+    def line_moves(self, columns) -> int:
+        board = transpose(self.board) if columns else self.board
+        moves = row_tables.moves
+        return moves[board & ROW_MASK] | moves[(board >> 16) & ROW_MASK] | moves[(board >> 32) & ROW_MASK] | moves[board >> 48]
+
+    def highest_tile(self) -> int:
+        """
+        Returns the highest tile on the board, or 0 if it is empty.
+        """
+        board = self.board
+        max_exponent = row_tables.max_exponent
+        exponent = max(max_exponent[board & ROW_MASK], max_exponent[(board >> 16) & ROW_MASK],
+            max_exponent[(board >> 32) & ROW_MASK], max_exponent[board >> 48])
+        return 1 << exponent if exponent else 0
+
+    def tile_counts(self) -> dict:
+        counts = {}
+        board = self.board
+        while board:
+            exponent = board & CELL_MASK
+            if exponent:
+                counts[1 << exponent] = counts.get(1 << exponent, 0) + 1
+            board >>= 4
+        return counts
+
+    def count_blanks(self) -> int:
+        board = self.board
+        blanks = row_tables.blanks
+        return (blanks[board & ROW_MASK] + blanks[(board >> 16) & ROW_MASK]
+            + blanks[(board >> 32) & ROW_MASK] + blanks[board >> 48])
+
+    def smoothness(self) -> int:
+        """
+        Returns the sum over every tile of the log2 differences to its non-blank neighbours.
+        """
+        board = self.board
+        columns = transpose(board)
+        smoothness = row_tables.smoothness
+        return (smoothness[board & ROW_MASK] + smoothness[(board >> 16) & ROW_MASK]
+            + smoothness[(board >> 32) & ROW_MASK] + smoothness[board >> 48]
+            + smoothness[columns & ROW_MASK] + smoothness[(columns >> 16) & ROW_MASK]
+            + smoothness[(columns >> 32) & ROW_MASK] + smoothness[columns >> 48])
+
+    def best_corner(self) -> int:
+        """
+        Returns the highest tile in a corner, or -1 if every corner is blank.
+        """
+        board = self.board
+        exponent = max(board & CELL_MASK, (board >> 12) & CELL_MASK, (board >> 48) & CELL_MASK, board >> 60)
+        return 1 << exponent if exponent else -1
+
+    def has_moves(self) -> bool:
+        """
+        Determines whether another move is possible.
+        """
+        board = self.board
+        # any blank cell
+        nonzero = board | (board >> 1)
+        nonzero |= nonzero >> 2
+        if (~nonzero) & 0x1111111111111111:
+            return True
+        # any pair of equal neighbours merges on a left (or, transposed, an up) shift
+        row_left = row_tables.left
+        for packed in (board, transpose(board)):
+            for shift in (0, 16, 32, 48):
+                row = (packed >> shift) & ROW_MASK
+                if row_left[row] != row:
+                    return True
+        return False
+
+    def iter_successors(self):
+        """
+        Lazily yields (action, next game state) for each legal action, shifting
+            the packed board directly instead of copying and testing each move.
+        """
+        board = self.board
+        columns = transpose(board)
+        for action in PLAYER_ACTIONS:
+            if action == 'up':
+                new_board, score_add = shift_rows(columns, row_tables.left, row_tables.left_score)
+                new_board = transpose(new_board)
+            elif action == 'down':
+                new_board, score_add = shift_rows(columns, row_tables.right, row_tables.right_score)
+                new_board = transpose(new_board)
+            elif action == 'left':
+                new_board, score_add = shift_rows(board, row_tables.left, row_tables.left_score)
+            else:
+                new_board, score_add = shift_rows(board, row_tables.right, row_tables.right_score)
+            if new_board != board:
+                successor = BitBoard.__new__(BitBoard)
+                successor.board = new_board
+                successor.score = self.score + score_add
+                yield (action, successor)
+
+    def horizontal_move(self, row_table, score_table) -> bool:
+        new_board, score_add = shift_rows(self.board, row_table, score_table)
+        changed = new_board != self.board
+        self.board = new_board
+        self.score += score_add
+        return changed
+
+    def vertical_move(self, row_table, score_table) -> bool:
+        new_board, score_add = shift_rows(transpose(self.board), row_table, score_table)
+        new_board = transpose(new_board)
+        changed = new_board != self.board
+        self.board = new_board
+        self.score += score_add
+        return changed
+
+    def left(self) -> bool:
+        return self.horizontal_move(row_tables.left, row_tables.left_score)
+
+    def right(self) -> bool:
+        return self.horizontal_move(row_tables.right, row_tables.right_score)
+
+    def up(self) -> bool:
+        return self.vertical_move(row_tables.left, row_tables.left_score)
+
+    def down(self) -> bool:
+        return self.vertical_move(row_tables.right, row_tables.right_score)
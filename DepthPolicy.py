@@ -0,0 +1,52 @@
+class AdaptiveDepthPolicy():
+    """
+    Picks each move's expectimax depth as the deepest whose estimated search
+        tree fits in a node budget. The estimate multiplies out the branching
+        of every ply: the board's legal moves at player nodes and a 2 and a 4
+        in every blank at chance nodes, one blank fewer after each spawn. Open
+        boards therefore search shallow and crowded ones deep. Boards holding
+        many distinct tile values are hard to keep in order, so the budget
+        grows by complexity_scale for each distinct value above simple_values.
+    """
+    def __init__(self, node_budget = 300, min_depth = 2, max_depth = 8, complexity_scale = 1.5, simple_values = 6) -> None:
+        self.node_budget = node_budget
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.complexity_scale = complexity_scale
+        self.simple_values = simple_values
+
+    def budget(self, board) -> float:
+        values = set(tile for row in board.spaces for tile in row if tile is not None)
+        return self.node_budget * self.complexity_scale ** max(0, len(values) - self.simple_values)
+
+    def estimated_nodes(self, moves, blanks, depth) -> int:
+        """
+        Returns the estimated number of nodes in a search of the given depth from a
+            board with the given legal move and blank counts.
+        """
+        total = 0
+        level = 1
+        spawns = 0
+        for ply in range(1, depth + 1):
+            if ply % 2:
+                level *= moves
+            else:
+                level *= 2 * max(1, blanks - spawns)
+                spawns += 1
+            total += level
+        return total
+
+    def depth(self, board) -> int:
+        """
+        Returns the search depth (ExpectimaxAgent.max_depth) to use on the board.
+        """
+        moves = max(1, len(board.get_legal_moves()))
+        blanks = len(board.get_blank_spaces())
+        budget = self.budget(board)
+        depth = self.min_depth
+        while depth < self.max_depth and self.estimated_nodes(moves, blanks, depth + 1) <= budget:
+            depth += 1
+        return depth
+
+    def __repr__(self):
+        return f"AdaptiveDepthPolicy({self.node_budget} nodes, depth {self.min_depth}-{self.max_depth})"
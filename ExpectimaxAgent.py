@@ -1,8 +1,31 @@
-from GameAgent import GameAgent, play_n_times, play_with_agent
+from GameAgent import GameAgent
 from GameBoard import GRID_SIZE
+from BitBoard import BitBoard
 from PerfTimer import perf_timer
+from TranspositionTable import TranspositionTable
+from DepthPolicy import AdaptiveDepthPolicy
+from MoveCache import MoveCache
 import math
-from threading import Thread
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+search_agent = None # agent used by the search pool workers
+
+def init_search_worker(agent):
+    global search_agent
+    search_agent = agent
+
+def search_worker_value(state, depth, probability, max_depth):
+    search_agent.max_depth = max_depth
+    return search_agent.value(state, depth, probability)
+
+TILE_PROBABILITIES = {2: 0.9, 4: 0.1}
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search that has run past its deadline.
+    """
+    pass
 
 class ExpectimaxState():
     def __init__(self, board, player_turn = True) -> None:
@@ -17,7 +40,7 @@ class ExpectimaxState():
         if self.player_turn:
             new_board.make_move(action)
         else:
-            new_board.spaces[action[0]][action[1]] = action[2]
+            new_board.set_tile(*action)
         return ExpectimaxState(new_board, not self.player_turn)
 
     def get_legal_actions(self, tile = 2):
@@ -34,74 +57,590 @@ class ExpectimaxState():
 
 
 class ExpectimaxAgent(GameAgent):
-    def __init__(self, max_depth = 3) -> None:
+    def __init__(self, max_depth = 3, cache_size = 0, workers = 0, prob_cutoff = 0, max_spawn_cells = None, time_limit = None, canonical_cache = False, pruning = False, batch_evaluation = False, depth_policy = None, node_budget = None, move_cache = None) -> None:
+        """
+        cache_size is the number of searched positions to keep in a transposition
+            table shared across moves, or 0 to search without one.
+        canonical_cache keys the table by the board's canonical symmetric form so
+            rotations and reflections share entries. The heuristics are symmetric,
+            but values summed in a different cell order can differ in the last bit.
+            It can't be combined with max_spawn_cells, whose sample of cells
+            depends on the board's orientation.
+        workers is the number of processes to spread each move's search over,
+            or 0 to search in this process.
+        prob_cutoff stops searching below states whose chance of being reached
+            from the current board is under it, evaluating them instead.
+        max_spawn_cells limits how many blank cells a chance node spawns tiles in,
+            spreading the chosen cells evenly over the blanks.
+        The defaults of 0 and None search every spawn, as before. With a cutoff,
+            cached values are shared between paths of different probability.
+        time_limit is a per-move budget in seconds. When set, each move deepens
+            the search one level at a time up to max_depth and plays the best
+            move of the deepest search that finished in time. This always
+            searches in this process.
+        pruning skips the rest of a chance node once it cannot beat the best
+            move found so far (Star1 pruning), using evaluation_bounds, and
+            searches the moves that evaluate best first. It always picks the
+            same move as the full search. Agents whose evaluation has no
+            bounds, and searches with workers, run the plain search instead.
+        batch_evaluation expands each move's whole tree before evaluating it,
+            then evaluates every distinct leaf in one evaluate_batch call (NumPy)
+            and backs the values up with the same arithmetic as the recursive
+            search, so moves and values are unchanged. It searches on BitBoards
+            and takes the place of the transposition table and of pruning.
+        depth_policy, if given, picks max_depth before every move from the
+            board (see DepthPolicy). node_budget is a shortcut for an
+            AdaptiveDepthPolicy with that budget, searching at most max_depth.
+        move_cache is the path of an SQLite file (or a MoveCache) of moves
+            searched before, by this or any earlier run with the same
+            configuration. Cached moves are played without searching; they can
+            differ from a new search only between equally valued moves. Moves
+            chosen under a time_limit depend on timing and are not cached.
+            Rotations and reflections of a board share its cached move, except
+            with max_spawn_cells, whose sample of cells depends on orientation.
+        """
+        if canonical_cache and max_spawn_cells is not None:
+            raise ValueError("canonical_cache can't be used with max_spawn_cells, which samples cells by orientation")
         self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.deadline = None
+        self.prob_cutoff = prob_cutoff
+        self.max_spawn_cells = max_spawn_cells
+        self.cache_size = cache_size
+        self.cache = TranspositionTable(cache_size) if cache_size else None
+        self.canonical_cache = canonical_cache
+        self.workers = workers
+        self.pruning = pruning
+        self.batch_evaluation = batch_evaluation
+        self.batch_leaf_seconds = 0.0 # time to evaluate a leaf in the last batch
+        if batch_evaluation:
+            # load NumPy and the tables now rather than within the first move's time limit
+            from BatchBoard import numpy_tables
+            numpy_tables()
+        if depth_policy is None and node_budget is not None:
+            depth_policy = AdaptiveDepthPolicy(node_budget, min(2, max_depth), max_depth)
+        self.depth_policy = depth_policy
+        if isinstance(move_cache, str):
+            move_cache = MoveCache(move_cache, self.search_config(), canonical=max_spawn_cells is None)
+        self.move_cache = move_cache
+        self.pool = None
+
+    def __getstate__(self):
+        # pool workers get their own empty cache and never start a pool of their own
+        state = self.__dict__.copy()
+        state['pool'] = None
+        state['workers'] = 0
+        state['cache'] = TranspositionTable(self.cache_size) if self.cache_size else None
+        return state
+
+    def get_pool(self):
+        """
+        Returns the agent's worker pool, starting it on first use.
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, initializer=init_search_worker, initargs=(self,))
+        return self.pool
+
+    def close(self) -> None:
+        """
+        Shuts down the worker pool, if one was started.
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.move_cache is not None:
+            self.move_cache.close()
+
+    def search_config(self) -> str:
+        """
+        Describes the settings other than depth that change which move the search picks.
+        """
+        return f"{type(self).__name__}(prob_cutoff={self.prob_cutoff}, max_spawn_cells={self.max_spawn_cells})"
     
     def get_terminal_value(self, state):
         return state.get_score()
 
+    @perf_timer.timed('expectimax.evaluate')
     def evaluate(self, state):
         return state.get_score()
         
+    def evaluation_bounds(self, state, depth):
+        """
+        Returns (lower, upper) bounds on the value of the state and of every
+            state searched below it, or None if there are none. Here values are
+            scores: they never fall, and a move gains at most the sum of the
+            tiles on the board, which each spawn raises by at most 4.
+        """
+        score = state.get_score()
+        return (score, score + self.score_gain_bound(state, depth))
+
+    def remaining_moves(self, state, depth) -> int:
+        """
+        Returns how many player moves can still be made below the state before max_depth.
+        """
+        remaining = self.max_depth - depth
+        return (remaining + 1) // 2 if state.player_turn else remaining // 2
+
+    def score_gain_bound(self, state, depth, counts = None) -> int:
+        """
+        Returns the most score the moves left before max_depth can gain. The next
+            move gains at most the best of the board's moves, plus one more
+            merge of the tile spawned first, and later ones at most every tile.
+        """
+        moves = self.remaining_moves(state, depth)
+        if moves == 0:
+            return 0
+        if counts is None:
+            counts = state.board.tile_counts()
+        score = state.get_score()
+        gain = max((successor.score for action, successor in state.board.iter_successors()), default=score) - score
+        first_spawns = 0 if state.player_turn else 1
+        if first_spawns:
+            # a spawned tile adds at most one merge to the line it lands in
+            gain += 2 * max(TILE_PROBABILITIES)
+        total = sum(tile * count for tile, count in counts.items())
+        return gain + sum(total + 4 * (first_spawns + i) for i in range(1, moves))
+
+    def highest_tile_bound(self, state, depth, counts = None) -> int:
+        """
+        Returns the highest tile the board can hold at max_depth. A move at most
+            doubles a tile, so a tile made in the moves left is the sum of tiles
+            at least its value / 2 ** moves, counting any tile spawned as a 4.
+        """
+        if counts is None:
+            counts = state.board.tile_counts()
+        moves = self.remaining_moves(state, depth)
+        spawns = self.max_depth - depth - moves
+        highest = max(max(counts, default=0), 4 if spawns else 0)
+        tile = 2 * highest
+        while tile <= highest << moves:
+            smallest = tile >> moves
+            total = sum(value * count for value, count in counts.items() if value >= smallest)
+            if smallest <= 4:
+                total += 4 * spawns
+            if total < tile:
+                break
+            highest = tile
+            tile *= 2
+        return highest
+
     def get_move(self, board):
-        return self.get_action(ExpectimaxState(board))
+        if not perf_timer.enabled or self.cache is None:
+            return self.get_action(ExpectimaxState(board))
+        hits, misses = self.cache.hits, self.cache.misses
+        action = self.get_action(ExpectimaxState(board))
+        perf_timer.count('expectimax.cache.hits', self.cache.hits - hits)
+        perf_timer.count('expectimax.cache.misses', self.cache.misses - misses)
+        return action
 
-    def max_value(self, state, depth):
+    def max_value(self, state, depth, probability = 1.0):
         """
         Computes max value for player turn.
         """
-        successors = [ExpectimaxState(board, not state.player_turn) for board in state.board.get_possible_successors()]
-        return max([self.value(successor, depth + 1) for successor in successors])
+        return max([self.value(ExpectimaxState(board, not state.player_turn), depth + 1, probability) for action, board in state.board.iter_successors()])
 
-    def avg_for_tile(self, state, depth, val):
+    def spawn_actions(self, state, val):
+        """
+        Returns the tile placements a chance node searches for the given tile value,
+            and the chance of each one happening.
+        """
+        actions = state.get_legal_actions(val)
+        probability = TILE_PROBABILITIES[val] / len(actions)
+        if self.max_spawn_cells is not None and len(actions) > self.max_spawn_cells:
+            actions = [actions[i * len(actions) // self.max_spawn_cells] for i in range(self.max_spawn_cells)]
+        return actions, probability
+
+    def avg_for_tile(self, state, depth, val, probability = 1.0):
         """
         Computes the average value for the adversary placing a tile of the given value.
         """
-        vals = [self.value(state.generate_successor(action), depth + 1) for action in state.get_legal_actions(val)]
+        actions, spawn_probability = self.spawn_actions(state, val)
+        vals = [self.value(state.generate_successor(action), depth + 1, probability * spawn_probability) for action in actions]
         return sum(vals) / len(vals)
 
-    def avg_value(self, state, depth):
+    def avg_value(self, state, depth, probability = 1.0):
         """
         Compute weighted average value for adversary turn.
         """
-        avg_for_2 = self.avg_for_tile(state, depth, 2)
-        avg_for_4 = self.avg_for_tile(state, depth, 4)
+        avg_for_2 = self.avg_for_tile(state, depth, 2, probability)
+        avg_for_4 = self.avg_for_tile(state, depth, 4, probability)
         return 0.9*avg_for_2 + 0.1*avg_for_4
 
-    def value(self, state, depth = 1):
+    @perf_timer.counted(key=lambda self, state, depth = 1, probability = 1.0: f"expectimax.nodes.depth{depth}")
+    def value(self, state, depth = 1, probability = 1.0):
         """
-        Computes the value of the state.
+        Computes the value of the state. probability is the chance of reaching
+            it from the board the search started at.
         """
         if state.is_over(): return self.get_terminal_value(state)
-        if depth >= self.max_depth: return self.evaluate(state)
-        if state.player_turn: return self.max_value(state, depth)
-        else: return self.avg_value(state, depth)
+        if depth >= self.max_depth or probability < self.prob_cutoff: return self.evaluate(state)
+        if self.cache is None: return self.search_value(state, depth, probability)
+
+        # identical positions at the same remaining depth have the same value
+        board_key = state.board.canonical()[0] if self.canonical_cache else state.board.hash_board()
+        key = (board_key, state.get_score(), self.max_depth - depth, state.player_turn)
+        val = self.cache.get(key)
+        if val is None:
+            val = self.search_value(state, depth, probability)
+            self.cache.put(key, val)
+        return val
+
+    @perf_timer.counted(key=lambda self, state, depth = 1, probability = 1.0, alpha = None: f"expectimax.nodes.depth{depth}")
+    def bounded_value(self, state, depth = 1, probability = 1.0, alpha = None):
+        """
+        Computes the value of the state, or an upper bound below alpha once it is
+            clear the value is below alpha. Returns (value, exact). Exact values
+            are the same as value gives, and only they are cached.
+        """
+        if state.is_over(): return (self.get_terminal_value(state), True)
+        if depth >= self.max_depth or probability < self.prob_cutoff: return (self.evaluate(state), True)
+        if self.cache is None: return self.bounded_search_value(state, depth, probability, alpha)
+
+        board_key = state.board.canonical()[0] if self.canonical_cache else state.board.hash_board()
+        key = (board_key, state.get_score(), self.max_depth - depth, state.player_turn)
+        val = self.cache.get(key)
+        if val is not None:
+            return (val, True)
+        val, exact = self.bounded_search_value(state, depth, probability, alpha)
+        if exact:
+            self.cache.put(key, val)
+        return (val, exact)
+
+    def bounded_search_value(self, state, depth, probability = 1.0, alpha = None):
+        if self.deadline is not None and perf_counter() > self.deadline: raise SearchTimeout()
+        if state.player_turn: return self.bounded_max_value(state, depth, probability, alpha)
+        else: return self.bounded_avg_value(state, depth, probability, alpha)
+
+    def bounded_max_value(self, state, depth, probability = 1.0, alpha = None):
+        """
+        Max node of the bounded search. Each child only has to beat the best exact
+            value so far (or alpha), and children that cannot are left as bounds.
+        """
+        best = None
+        bound = None # highest upper bound of a child that was cut off
+        children = [ExpectimaxState(board, not state.player_turn) for action, board in state.board.iter_successors()]
+        for child in self.search_order(children, depth + 1):
+            child_alpha = alpha if best is None or (alpha is not None and alpha > best) else best
+            val, exact = self.bounded_value(child, depth + 1, probability, child_alpha)
+            if exact:
+                best = val if best is None else max(best, val)
+            else:
+                bound = val if bound is None else max(bound, val)
+        if bound is None or (best is not None and bound < best):
+            return (best, True)
+        return (bound if best is None else max(best, bound), False)
+
+    def bounded_avg_value(self, state, depth, probability = 1.0, alpha = None):
+        """
+        Chance node of the bounded search. Once the children searched so far, with
+            the rest at their upper bound, cannot reach alpha, returns that bound.
+            Otherwise averages exactly as avg_value does.
+        """
+        bounds = None if alpha is None else self.evaluation_bounds(state, depth)
+        if bounds is None:
+            return (self.avg_value(state, depth, probability), True)
+        lower, upper = bounds
+        # keeps every bound on the safe side of floating point rounding
+        margin = 1e-9 * (abs(lower) + abs(upper) + abs(alpha) + 1)
+        if upper + margin < alpha:
+            return (upper + margin, False)
+        total = 0 # probability-weighted sum of the exact child values so far
+        remaining = 1.0 # probability of the children not yet searched
+        averages = []
+        for val in TILE_PROBABILITIES:
+            actions, spawn_probability = self.spawn_actions(state, val)
+            weight = TILE_PROBABILITIES[val] / len(actions)
+            vals = []
+            for action in actions:
+                remaining -= weight
+                child = state.generate_successor(action)
+                child_probability = probability * spawn_probability
+                # the child value below which this node cannot reach alpha
+                child_alpha = (alpha - total - upper * remaining - margin) / weight
+                child_val, exact = self.bounded_value(child, depth + 1, child_probability, child_alpha if child_alpha > lower else None)
+                if not exact:
+                    node_bound = total + weight * child_val + upper * remaining + margin
+                    if node_bound < alpha:
+                        return (node_bound, False)
+                    child_val, exact = self.bounded_value(child, depth + 1, child_probability)
+                vals.append(child_val)
+                total += weight * child_val
+                node_bound = total + upper * remaining + margin
+                if node_bound < alpha:
+                    return (node_bound, False)
+            averages.append(sum(vals) / len(vals))
+        avg_for_2, avg_for_4 = averages
+        return (0.9*avg_for_2 + 0.1*avg_for_4, True)
+
+    def action_values(self, successors):
+        """
+        Returns the value of each successor of the current board. With pruning,
+            successors that cannot beat an earlier one get an upper bound below
+            the best value instead, so the best value and its action are unchanged.
+        """
+        if self.batch_evaluation:
+            return self.batch_values(successors)
+        if not self.pruning or not successors or self.evaluation_bounds(successors[0], 1) is None:
+            return [self.value(successor) for successor in successors]
+        values = {}
+        best = None
+        for successor in self.search_order(successors, 1):
+            val, exact = self.bounded_value(successor, 1, 1.0, best)
+            values[id(successor)] = val
+            if exact and (best is None or val > best):
+                best = val
+        return [values[id(successor)] for successor in successors]
+
+    def search_order(self, states, depth):
+        """
+        Returns the states at depth in the order the bounded search visits them:
+            best evaluation first, so the best value is usually found first and
+            cuts off more of its siblings. Leaves are left in order, as they are
+            evaluated anyway.
+        """
+        if depth >= self.max_depth:
+            return states
+        return sorted(states, key=self.evaluate, reverse=True)
+
+    def evaluate_batch(self, boards, scores):
+        """
+        Returns evaluate for arrays of packed boards (uint64) and their scores (int64).
+        """
+        return scores
+
+    def batch_values(self, successors):
+        """
+        Returns the value of each successor of the current board, as value would,
+            by expanding every tree to its leaves and evaluating the distinct
+            leaves together. Game-over leaves get their terminal value instead.
+        """
+        import numpy as np
+        from BatchBoard import packed_rows, transpose_packed, packed_has_moves
+        leaves = {} # (packed board, score) -> leaf index
+        # without a cutoff a node's value depends only on its board, score, depth and turn
+        expanded = {} if self.prob_cutoff == 0 else None
+        trees = [self.expand(successor.board if isinstance(successor.board, BitBoard) else BitBoard.from_board(successor.board),
+            successor.player_turn, 1, 1.0, leaves, expanded) for successor in successors]
+        # evaluate_batch can't be interrupted, so only start it if the last batch's rate says it finishes in time;
+        # depth 1 only evaluates and always finishes, as in the recursive search, so deepening has a move to play
+        if self.deadline is not None and self.max_depth > 1 and perf_counter() + self.batch_leaf_seconds * len(leaves) > self.deadline:
+            raise SearchTimeout()
+        start = perf_counter()
+        boards = np.fromiter((board for board, score in leaves), dtype=np.uint64, count=len(leaves))
+        scores = np.fromiter((score for board, score in leaves), dtype=np.int64, count=len(leaves))
+        leaf_values = self.evaluate_batch(boards, scores).tolist()
+        over = np.flatnonzero(~packed_has_moves(packed_rows(boards), packed_rows(transpose_packed(boards))))
+        for i in over.tolist():
+            leaf_values[i] = self.get_terminal_value(ExpectimaxState(BitBoard.from_packed(int(boards[i]), int(scores[i]))))
+        self.batch_leaf_seconds = (perf_counter() - start) / max(1, len(leaves))
+        backed_up = {}
+        return [self.back_up(tree, leaf_values, backed_up) for tree in trees]
+
+    def expand(self, board, player_turn, depth, probability, leaves, expanded):
+        """
+        Builds the search tree below a BitBoard for batch_values. A leaf is its
+            index in leaves, a game-over state a 1-tuple of its value, a player
+            node a list of its children and a chance node a tuple of its 2 and 4 spawn children.
+        """
+        if depth >= self.max_depth or probability < self.prob_cutoff:
+            key = (board.board, board.score)
+            index = leaves.get(key)
+            if index is None:
+                index = leaves[key] = len(leaves)
+            return index
+        if self.deadline is not None and perf_counter() > self.deadline: raise SearchTimeout()
+        if expanded is not None:
+            key = (board.board, board.score, depth, player_turn)
+            node = expanded.get(key)
+            if node is not None:
+                return node
+        state = ExpectimaxState(board, player_turn)
+        if state.is_over():
+            node = (self.get_terminal_value(state),)
+        elif player_turn:
+            node = [self.expand(successor, False, depth + 1, probability, leaves, expanded) for action, successor in board.iter_successors()]
+        else:
+            children = []
+            for val in TILE_PROBABILITIES:
+                actions, spawn_probability = self.spawn_actions(state, val)
+                children.append([self.expand(state.generate_successor(action).board, True, depth + 1, probability * spawn_probability, leaves, expanded)
+                    for action in actions])
+            node = tuple(children)
+        if expanded is not None:
+            expanded[key] = node
+        return node
+
+    def back_up(self, node, leaf_values, backed_up):
+        """
+        Returns the value of a tree from expand, combining values as max_value and avg_value do.
+        """
+        if type(node) is int:
+            return leaf_values[node]
+        if len(node) == 1 and type(node) is tuple:
+            return node[0]
+        val = backed_up.get(id(node))
+        if val is not None:
+            return val
+        if self.deadline is not None and perf_counter() > self.deadline: raise SearchTimeout()
+        if type(node) is list:
+            val = max([self.back_up(child, leaf_values, backed_up) for child in node])
+        else:
+            avg_for_2, avg_for_4 = [sum(vals) / len(vals) for vals in
+                ([self.back_up(child, leaf_values, backed_up) for child in children] for children in node)]
+            val = 0.9*avg_for_2 + 0.1*avg_for_4
+        backed_up[id(node)] = val
+        return val
+
+    def search_value(self, state, depth, probability = 1.0):
+        """
+        Computes the value of a non-leaf state by searching its successors.
+        """
+        if self.deadline is not None and perf_counter() > self.deadline: raise SearchTimeout()
+        if state.player_turn: return self.max_value(state, depth, probability)
+        else: return self.avg_value(state, depth, probability)
+
+    def parallel_values(self, game_state, actions):
+        """
+        Computes the value of each action, searching the children of every
+            resulting chance node in the worker pool. Gives the same values as
+            searching in this process.
+        """
+        pool = self.get_pool()
+        jobs = []
+        for action in actions:
+            successor = game_state.generate_successor(action)
+            if successor.is_over() or 1 >= self.max_depth:
+                jobs.append(self.value(successor))
+                continue
+            tile_jobs = []
+            for tile in (2, 4):
+                spawns, probability = self.spawn_actions(successor, tile)
+                tile_jobs.append([pool.submit(search_worker_value, successor.generate_successor(spawn), 2, probability, self.max_depth)
+                    for spawn in spawns])
+            jobs.append(tile_jobs)
+        values = []
+        for job in jobs:
+            if isinstance(job, list):
+                avg_for_2, avg_for_4 = [sum(future.result() for future in futures) / len(futures) for futures in job]
+                job = 0.9*avg_for_2 + 0.1*avg_for_4
+            values.append(job)
+        return values
 
     def get_action(self, game_state):
+        if self.depth_policy is not None:
+            self.max_depth = self.depth_policy.depth(game_state.board)
+        if self.time_limit is not None:
+            return self.deepening_action(game_state)
+        if self.move_cache is not None:
+            cached = self.move_cache.get(game_state.board, self.max_depth)
+            if cached is not None:
+                return cached[0]
+        actions = game_state.get_legal_actions()
+        if self.workers > 1:
+            action_values = self.parallel_values(game_state, actions)
+        else:
+            action_values = self.action_values([game_state.generate_successor(action) for action in actions])
+        action = self.best_action(actions, action_values)
+        if self.move_cache is not None:
+            self.move_cache.put(game_state.board, self.max_depth, action, action_values[actions.index(action)])
+        return action
+
+    def best_action(self, actions, action_values):
+        """
+        Returns the first action with the highest value.
+        """
         best_action = None
         best_action_value = 0
-        for action in game_state.get_legal_actions():
-            action_value = self.value(game_state.generate_successor(action))
+        for action, action_value in zip(actions, action_values):
             if best_action == None or action_value > best_action_value:
                 best_action = action
                 best_action_value = action_value
         return best_action
 
+    def deepening_action(self, game_state):
+        """
+        Searches at increasing depths until time_limit runs out and returns the
+            best action of the deepest completed search. Each depth searches the
+            previous depth's best actions first, and the transposition table,
+            if any, carries over between depths.
+        """
+        start = perf_counter()
+        max_depth = self.max_depth
+        actions = game_state.get_legal_actions()
+        successors = {action: game_state.generate_successor(action) for action in actions}
+        order = actions
+        best_action = None
+        try:
+            self.deadline = start + self.time_limit
+            for depth in range(1, max_depth + 1):
+                iteration_start = perf_counter()
+                self.max_depth = depth
+                values = dict(zip(order, self.action_values([successors[action] for action in order])))
+                best_action = self.best_action(actions, [values[action] for action in actions])
+                order = sorted(actions, key=lambda action: values[action], reverse=True)
+                # the next depth takes at least as long as this one
+                if perf_counter() + (perf_counter() - iteration_start) > self.deadline:
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.max_depth = max_depth
+            self.deadline = None
+        return best_action
+
 
 class CornersExpectimaxAgent(ExpectimaxAgent):
     """
         Expectimax Agent that is rewarded for putting as high numbered of a tile on one of the corners as possible
     """
     def get_terminal_value(self, state):
-        # return 0
         # highest tile
-        highestVal = 0
-        for row in range(GRID_SIZE):
-            for col in range(GRID_SIZE):
-                tile = state.board.spaces[row][col]
-                if tile != None: highestVal = max(highestVal, tile)
-        return highestVal
+        return state.board.highest_tile()
     
+    def evaluation_bounds(self, state, depth):
+        """
+        Evaluations and terminal values are at least the current highest tile or
+            5 * score + 10 * highest tile - 1000 (no tile in a corner), as
+            neither ever falls, and at most 5 * the highest reachable score
+            + 10 * the highest reachable tile + 1000 * the highest tile that can
+            reach a corner.
+        """
+        score = state.get_score()
+        highest = self.get_terminal_value(state)
+        counts = state.board.tile_counts()
+        highest_bound = self.highest_tile_bound(state, depth, counts)
+        corner_bound = self.corner_tile_bound(state, depth, highest_bound)
+        return (min(highest, 5 * score + 10 * highest - 1000),
+            5 * (score + self.score_gain_bound(state, depth, counts)) + 10 * highest_bound + 1000 * corner_bound)
+
+    def corner_tile_bound(self, state, depth, highest_bound) -> int:
+        """
+        Returns the highest tile that can be in a corner at max_depth. With no
+            moves left only a spawn can change the corners. One move only brings
+            a corner tiles from its own edge rows and columns, doubling the
+            highest of an edge only if it holds two of them.
+        """
+        moves = self.remaining_moves(state, depth)
+        spawn = 4 if depth < self.max_depth else -1
+        if moves == 0:
+            return max(self._evaluate_corners(state), spawn)
+        if moves > 1:
+            return highest_bound
+        spaces = state.board.spaces
+        edges = (spaces[0], spaces[GRID_SIZE-1], [row[0] for row in spaces], [row[GRID_SIZE-1] for row in spaces])
+        bound = spawn if state.player_turn else 2 * spawn
+        for edge in edges:
+            tiles = [tile for tile in edge if tile is not None]
+            if tiles:
+                top = max(tiles)
+                bound = max(bound, 2 * top if tiles.count(top) > 1 else top)
+        return bound
+
+    def evaluate_batch(self, boards, scores):
+        from BatchBoard import packed_rows, packed_highest_tiles, packed_best_corners
+        return 5*scores + 10*packed_highest_tiles(packed_rows(boards)) + 1000*packed_best_corners(boards)
+
+    @perf_timer.timed('expectimax.evaluate')
     def evaluate(self, state):
         return 5* state.get_score() + 10 *self.get_terminal_value(state) + 1000 * self._evaluate_corners(state)
     
@@ -109,13 +648,7 @@ class CornersExpectimaxAgent(ExpectimaxAgent):
         """
             Returns the sum of the values in the corners
         """
-        spaces = state.board.spaces
-        corners = [spaces[0][0], spaces[0][GRID_SIZE-1], spaces[GRID_SIZE-1][0], spaces[GRID_SIZE-1][GRID_SIZE-1]]
-        max_val = -1
-        for corner in corners:
-            if corner is not None:
-                max_val = max(max_val, corner)
-        return max_val
+        return state.board.best_corner()
 
 
 class SmoothEmptyCornersExpectimaxAgent(ExpectimaxAgent):
@@ -129,82 +662,37 @@ class SmoothEmptyCornersExpectimaxAgent(ExpectimaxAgent):
 
     """
     def get_terminal_value(self, state):
-        # return 0
         # highest tile
-        highestVal = 0
-        for row in range(GRID_SIZE):
-            for col in range(GRID_SIZE):
-                tile = state.board.spaces[row][col]
-                if tile != None: highestVal = max(highestVal, tile)
-        return highestVal
+        return state.board.highest_tile()
     
+    def evaluation_bounds(self, state, depth):
+        # smoothness has no useful bound, so this agent never prunes
+        return None
+
+    def evaluate_batch(self, boards, scores):
+        import numpy as np
+        from BatchBoard import numpy_tables, packed_rows, transpose_packed, packed_highest_tiles, packed_best_corners
+        tables = numpy_tables()
+        rows = packed_rows(boards)
+        cols = packed_rows(transpose_packed(boards))
+        smoothness = tables['smoothness'][rows].sum(axis=1, dtype=np.int64) + tables['smoothness'][cols].sum(axis=1, dtype=np.int64)
+        too_few_empty = tables['blanks'][rows].sum(axis=1, dtype=np.int64) <= 3
+        return (5*scores + 10*packed_highest_tiles(rows) - 1000*smoothness + 1000*packed_best_corners(boards)
+            - 500*too_few_empty.astype(np.int64))
+
+    @perf_timer.timed('expectimax.evaluate')
     def evaluate(self, state):
         return 5*state.get_score() + 10 * self.get_terminal_value(state) - 1000* self._smoothness_value(state) + 1000 * self._evaluate_corners(state)- 500  * self._too_few_empty(state)
 
     def _smoothness_value(self, state):
-        smoothness = 0
-        for row in range(GRID_SIZE):
-            for col in range(GRID_SIZE):
-                tile = state.board.spaces[row][col]
-                if tile is not None:
-                    smoothness += self._calculate_neighbor_differences(state, row, col)
-        return smoothness
-    
-    def _calculate_neighbor_differences(self, state, row, col):
-        spaces = state.board.spaces
-        current_val = spaces[row][col]
-        differences = 0
-        neighbors = []
-        if row != 0:
-            neighbors.append(spaces[row - 1][col])
-        if row != GRID_SIZE - 1:
-            neighbors.append(spaces[row + 1][col])
-        if col != 0:
-            neighbors.append(spaces[row][col-1])
-        if col != GRID_SIZE - 1:
-            neighbors.append(spaces[row][col + 1])
-        for neighbor in neighbors:
-            if neighbor is not None:
-                differences += abs(math.log(current_val, 2) - math.log(neighbor, 2))
-
-        return differences
+        return state.board.smoothness()
 
     def _too_few_empty(self, state):
-        num_empty = 0
-        for row in range(GRID_SIZE):
-            for col in range(GRID_SIZE):
-                tile = state.board.spaces[row][col]
-                if tile is None: num_empty += 1
-        if num_empty <= 3:
-            return 1
-        else:
-            return 0
+        return 1 if state.board.count_blanks() <= 3 else 0
 
     #Try this with corners
     def _evaluate_corners(self, state):
         """
             Returns the sum of the values in the corners
         """
-        spaces = state.board.spaces
-        corners = [spaces[0][0], spaces[0][GRID_SIZE-1], spaces[GRID_SIZE-1][0], spaces[GRID_SIZE-1][GRID_SIZE-1]]
-        max_val = -1
-        for corner in corners:
-            if corner is not None:
-                max_val = max(max_val, corner)
-        return max_val
-
-class ThreadRunner(Thread):
-    def __init__(self):
-        super().__init__()
-
-    def run(self):
-        play_n_times(CornersExpectimaxAgent(5), 10, verbose=True)
-
-t = ThreadRunner()
-
-t.start()
-#play_n_times(SmoothnessExpectimaxAgent(5), 3, verbose=True)
-
-#play_with_agent(ExpectimaxAgent(5))
-
-# play_n_times(ExpectimaxAgent(2), 10)
+        return state.board.best_corner()
@@ -1,39 +1,136 @@
+import random
 import statistics
 from GameBoard import GameBoard
-from time import time
+from GameRecord import GameRecord
+from PerfTimer import perf_timer
+from time import time, perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 class GameAgent():
   def get_move(self, board):
     pass
 
-def play_with_agent(agent, show_board = True, mute = False):
+  def reset(self):
+    """
+    Called at the start of every game to clear any per-game state.
+    """
+    pass
+
+game_agent = None # agent used by the game pool workers
+
+def init_game_worker(agent):
+    global game_agent
+    game_agent = agent
+
+def play_with_agent(agent, show_board = True, mute = False, board_class = GameBoard, record = None):
     """
     Simulates gameplay with the given agent.
+    board_class selects the board backend (GameBoard or BitBoard).
+    A GameRecord passed as record is filled in with the game's moves, spawns and timings.
     """
-    board = GameBoard()
+    agent.reset()
+    get_move = perf_timer.timed('agent.get_move')(agent.get_move)
+    board = board_class()
+    if record is not None: record.start(board)
     if show_board: print(board)
     while board.has_moves():
-        if board.make_move(agent.get_move(board)):
-            board.add_random_tile()
+        if record is None:
+            if board.make_move(get_move(board)):
+                board.add_random_tile()
+        else:
+            start = perf_counter()
+            action = get_move(board)
+            elapsed = perf_counter() - start
+            record.add_move(action, board.add_random_tile() if board.make_move(action) else None, elapsed)
         if show_board: print(board)
     highestTile = max(map(max, board.spaces))
+    if record is not None: record.finish(board)
     if not mute: 
         print("Game over\nScore:", board.score, "\nHighest Tile:", highestTile)
+    if perf_timer.enabled:
+        stats = perf_timer.end_game()
+        if not mute: perf_timer.report(stats, 'Game')
     return (board.score, highestTile)
 
-def play_n_times(agent, num_games = 100, verbose = False):
-    scores = []
-    highestTiles = []
-    for i in range(num_games):
-        ts = time()
-        score, highestTile = play_with_agent(agent, False, True)
+def play_seeded_game(agent, seed, board_class = GameBoard, record = None):
+    """
+    Plays one silent game with the random module seeded first, so the same seed
+        always gives the same game. Returns the score, highest tile and time taken.
+    """
+    if seed is not None:
+        random.seed(seed)
+    ts = time()
+    score, highestTile = play_with_agent(agent, False, True, board_class, record)
+    return (score, highestTile, time() - ts)
+
+def play_game_worker(index, seed, board_class, recording):
+    """
+    Plays a game in a pool worker, returning its stats and record, if recording,
+        for the parent to merge and write.
+    """
+    record = GameRecord(seed) if recording else None
+    result = (index, *play_seeded_game(game_agent, seed, board_class, record))
+    stats = perf_timer.run_stats
+    perf_timer.reset()
+    return (*result, stats, record)
+
+def game_seeds(seed, num_games):
+    """
+    Returns an independent seed for each game, derived from one run seed.
+    """
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for i in range(num_games)]
+
+def play_games(agent, num_games = 100, board_class = GameBoard, workers = 1, seed = None, recorder = None):
+    """
+    Plays games with the agent, yielding (game index, score, highest tile, seconds)
+        as each game finishes. With a seed, each game gets its own seed from
+        game_seeds and gives the same result however many workers are used.
+        With more than one worker, games are spread over a process pool.
+        Each game is written to the recorder (a GameRecorder), if one is given,
+        as it finishes.
+    """
+    if seed is None and workers > 1:
+        seed = random.randrange(2**32)
+    seeds = [None] * num_games if seed is None else game_seeds(seed, num_games)
+    if workers <= 1:
+        for i in range(num_games):
+            record = GameRecord(seeds[i]) if recorder is not None else None
+            result = (i, *play_seeded_game(agent, seeds[i], board_class, record))
+            if record is not None: recorder.write(record)
+            yield result
+        return
+    with ProcessPoolExecutor(workers, initializer=init_game_worker, initargs=(agent,)) as pool:
+        futures = [pool.submit(play_game_worker, i, seeds[i], board_class, recorder is not None) for i in range(num_games)]
+        for future in as_completed(futures):
+            *result, stats, record = future.result()
+            perf_timer.merge(stats)
+            if record is not None: recorder.write(record)
+            yield tuple(result)
+
+def play_n_times(agent, num_games = 100, verbose = False, board_class = GameBoard, workers = 1, seed = None, recorder = None):
+    """
+    Plays num_games games with the agent and prints summary statistics.
+        Returns the scores and highest tiles in game order.
+    """
+    scores = [None] * num_games
+    highestTiles = [None] * num_games
+    completed = 0
+    for i, score, highestTile, elapsed in play_games(agent, num_games, board_class, workers, seed, recorder):
+        completed += 1
         if verbose:
-            print(f"Completed game {i + 1}/{num_games}! Score: {score} Highest Tile: {highestTile}")
-            print(f"Game completed in {time()-ts} seconds")
-        scores.append(score)
-        highestTiles.append(highestTile)
+            print(f"Completed game {completed}/{num_games}! Score: {score} Highest Tile: {highestTile}")
+            print(f"Game completed in {elapsed} seconds")
+        scores[i] = score
+        highestTiles[i] = highestTile
+    print_results(scores, highestTiles)
+    if perf_timer.enabled:
+        perf_timer.report()
+    return (scores, highestTiles)
+
+def print_results(scores, highestTiles):
     avgScore = sum(scores) / len(scores)
-    print("Average score after", num_games, "games:", avgScore)
+    print("Average score after", len(scores), "games:", avgScore)
     print("Highest tile attained:", max(highestTiles))
     print("Median highest tile:", statistics.median(highestTiles))
     _tile_distribution(highestTiles)
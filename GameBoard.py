@@ -1,85 +1,59 @@
 import random
 import math
-import itertools
 from PerfTimer import perf_timer
+from RowTables import row_tables, shift_row_left, shift_row_right, LEFT_CHANGES, RIGHT_CHANGES
+from Symmetry import canonical_form
 
 CELL_WIDTH = 7
 CELL_HEIGHT = 3
 BASE_NUMBER = 2
 GRID_SIZE = 4
 PLAYER_ACTIONS = ['up', 'down', 'left', 'right']
+# whether each direction shifts columns, and the line change bit it needs
+DIRECTION_LINES = {'up': (True, LEFT_CHANGES), 'down': (True, RIGHT_CHANGES),
+    'left': (False, LEFT_CHANGES), 'right': (False, RIGHT_CHANGES)}
 
-row_left_perms = {} # map row to left shift performed on row
-row_right_perms = {} # map row to right shift performed on row
-
-def find_first_left(row_copy, col) -> tuple[int, int]:
-    """
-    Returns a tuple of the value of the first non-empty cell to the left of the given one,
-        and the column index of that cell.
-        Returns None if no cell found.
-    """
-    for i in range(col-1, -1, -1):
-        if row_copy[i] is not None:
-            return (row_copy[i], i)
-    return None
-
-# fill out left and right shift maps (used for more efficient game logic)
-
-for row in itertools.product(*[range(18)]*4):
-    tiles = []
-    for num in row:
-        if num == 0:
-            tiles.append(None)
-        else:
-            tiles.append(2**num)
-    
-    row_copy = [None] * GRID_SIZE
-    changed = False
-    score_add = 0
-
-    for col in range(GRID_SIZE):
-        if tiles[col] is None:
-            continue
-        if col == 0:
-            row_copy[col] = tiles[col]
-            continue
-        first_left = find_first_left(row_copy, col)
-        if first_left is None:
-            changed = True
-            row_copy[0] = tiles[col]
-        elif first_left[0] == tiles[col]:
-            changed = True
-            row_copy[first_left[1]] *= -2
-            score_add += tiles[col] * 2
-        elif first_left[1] < col - 1:
-            changed = True
-            row_copy[first_left[1] + 1] = tiles[col]
-        else:
-            row_copy[col] = tiles[col]
-
-    new_row = [None] * GRID_SIZE
-    for col in range(GRID_SIZE):
-        if row_copy[col] is None:
-            new_row[col] = None
-        else:
-            new_row[col] = abs(row_copy[col])
-    
-    row_left_perms[tuple(tiles)] = (new_row, changed, score_add)
-    row_right_perms[tuple(reversed(tiles))] = (list(reversed(new_row)), changed, score_add)
+# exponent of each tile the lookup tables can merge, and the tile for each exponent
+tile_exponents = {None: 0, **{2**num: num for num in range(1, 15)}}
+exponent_tiles = [None] + [2**num for num in range(1, 16)]
 
 def row_left(row):
     """
     Given an array representing a row, perform a left shift on it.
     """
-    new_row, changed, score_add = row_left_perms[tuple(row)]
-    return new_row.copy(), changed, score_add
+    try:
+        packed = tile_exponents[row[0]] | tile_exponents[row[1]] << 4 | tile_exponents[row[2]] << 8 | tile_exponents[row[3]] << 12
+    except KeyError:
+        return shift_row_left(row) # tile too large for the lookup tables
+    new_packed = row_tables.left[packed]
+    new_row = [exponent_tiles[new_packed & 0xF], exponent_tiles[(new_packed >> 4) & 0xF],
+        exponent_tiles[(new_packed >> 8) & 0xF], exponent_tiles[new_packed >> 12]]
+    return new_row, new_packed != packed, row_tables.left_score[packed]
 
 def row_right(row):
     """
     Given an array representing a row, perform a right shift on it.
     """
-    new_row, changed, score_add = row_right_perms[tuple(row)]
-    return new_row.copy(), changed, score_add
+    try:
+        packed = tile_exponents[row[0]] | tile_exponents[row[1]] << 4 | tile_exponents[row[2]] << 8 | tile_exponents[row[3]] << 12
+    except KeyError:
+        return shift_row_right(row) # tile too large for the lookup tables
+    new_packed = row_tables.right[packed]
+    new_row = [exponent_tiles[new_packed & 0xF], exponent_tiles[(new_packed >> 4) & 0xF],
+        exponent_tiles[(new_packed >> 8) & 0xF], exponent_tiles[new_packed >> 12]]
+    return new_row, new_packed != packed, row_tables.right_score[packed]
+
+def line_moves(a, b, c, d) -> int:
+    """
+    Given the four tiles of a row or column, returns LEFT_CHANGES and RIGHT_CHANGES
+        bits for whether shifting it towards the first or last tile changes anything.
+    """
+    try:
+        return row_tables.moves[tile_exponents[a] | tile_exponents[b] << 4 | tile_exponents[c] << 8 | tile_exponents[d] << 12]
+    except KeyError:
+        # tile too large for the lookup tables
+        line = [a, b, c, d]
+        return (LEFT_CHANGES if shift_row_left(line)[1] else 0) | (RIGHT_CHANGES if shift_row_right(line)[1] else 0)
 
 class GameBoard():
     def __init__(self, add_tiles = True) -> None:
@@ -93,6 +67,7 @@ class GameBoard():
             self.add_random_tile()
             self.add_random_tile()
 
+    @perf_timer.counted('board.copies')
     def copy(self):
         new_board = GameBoard(False)
         new_board.score = self.score
@@ -103,6 +78,34 @@ class GameBoard():
     def hash_board(self):
         return str(self.spaces)
 
+    def set_tile(self, row, col, value) -> None:
+        self.spaces[row][col] = value
+
+    def pack(self) -> int:
+        """
+        Returns the board packed into a 64-bit integer of 4-bit log2 exponents,
+            with cell (row, col) stored at bits 4 * (GRID_SIZE * row + col).
+            Raises ValueError if a tile is too large to fit in 4 bits.
+        """
+        packed = 0
+        for i in range(GRID_SIZE):
+            for j in range(GRID_SIZE):
+                tile = self.spaces[i][j]
+                if tile is not None:
+                    exponent = tile.bit_length() - 1
+                    if exponent > 15:
+                        raise ValueError(f"Tile {tile} does not fit in a packed board")
+                    packed |= exponent << (4 * (GRID_SIZE * i + j))
+        return packed
+
+    def canonical(self) -> tuple[int, int]:
+        """
+        Returns the smallest packed form among the board's 8 rotations and reflections,
+            and the Symmetry transform that produces it. Symmetric boards share
+            the same key; Symmetry.transform_action maps moves into its frame.
+        """
+        return canonical_form(self.pack())
+
     def __repr__(self):
         # print top lines and first row of numbers/spaces
         out = self.top_lines()
@@ -166,14 +169,61 @@ class GameBoard():
                     blank_spaces += [(i, j)]
         return blank_spaces
 
-    def add_random_tile(self) -> None:
+    def count_blanks(self) -> int:
+        return sum(row.count(None) for row in self.spaces)
+
+    def highest_tile(self) -> int:
+        """
+        Returns the highest tile on the board, or 0 if it is empty.
+        """
+        return max((tile for row in self.spaces for tile in row if tile is not None), default=0)
+
+    def best_corner(self) -> int:
+        """
+        Returns the highest tile in a corner, or -1 if every corner is blank.
+        """
+        spaces = self.spaces
+        corners = (spaces[0][0], spaces[0][GRID_SIZE-1], spaces[GRID_SIZE-1][0], spaces[GRID_SIZE-1][GRID_SIZE-1])
+        return max((corner for corner in corners if corner is not None), default=-1)
+
+    def smoothness(self) -> int:
+        """
+        Returns the sum over every tile of the log2 differences to its non-blank neighbours.
+        """
+        exponents = [[None if tile is None else tile.bit_length() - 1 for tile in row] for row in self.spaces]
+        smoothness = 0
+        for row in range(GRID_SIZE):
+            for col in range(GRID_SIZE):
+                exponent = exponents[row][col]
+                if exponent is None:
+                    continue
+                for i, j in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+                    if 0 <= i < GRID_SIZE and 0 <= j < GRID_SIZE and exponents[i][j] is not None:
+                        smoothness += abs(exponent - exponents[i][j])
+        return smoothness
+
+    def tile_counts(self) -> dict:
+        """
+        Returns {tile: number of times it is on the board}.
+        """
+        counts = {}
+        for row in self.spaces:
+            for tile in row:
+                if tile is not None:
+                    counts[tile] = counts.get(tile, 0) + 1
+        return counts
+
+    def add_random_tile(self) -> tuple[int, int, int]:
         """
         Adds a random tile to a blank space on the board.
+        Returns the row, column and value of the new tile.
         """
         selected_space = random.choice(self.get_blank_spaces())
 
         # set space to one of the 
-        self.spaces[selected_space[0]][selected_space[1]] = random.choices([BASE_NUMBER, BASE_NUMBER * 2], weights=[0.9, 0.1])[0]
+        tile = random.choices([BASE_NUMBER, BASE_NUMBER * 2], weights=[0.9, 0.1])[0]
+        self.spaces[selected_space[0]][selected_space[1]] = tile
+        return (*selected_space, tile)
 
     def has_moves(self) -> bool:
         """
@@ -251,6 +301,7 @@ class GameBoard():
         """
         return self.vertical_move(row_right)
     
+    @perf_timer.counted('board.moves')
     def make_move(self, direction) -> bool:
         """
         Given a direction, attempt to move the tiles in that direction. 
@@ -258,24 +309,45 @@ class GameBoard():
         """
         return getattr(self, direction)()
 
+    def line_moves(self, columns) -> int:
+        """
+        Returns the line_moves bits of every row (or column) OR-ed together,
+            without copying or moving the board.
+        """
+        spaces = self.spaces
+        moves = 0
+        for i in range(GRID_SIZE):
+            if columns:
+                moves |= line_moves(spaces[0][i], spaces[1][i], spaces[2][i], spaces[3][i])
+            else:
+                moves |= line_moves(*spaces[i])
+        return moves
+
     def is_legal_move(self, direction) -> bool:
         """
         Return whether moving in a given direction will have any effect.
         """
-        return self.copy().make_move(direction)
+        columns, change = DIRECTION_LINES[direction]
+        return bool(self.line_moves(columns) & change)
 
     def get_legal_moves(self) -> list:
         """
         Return a list of legal move directions.
         """
-        return [action for action in PLAYER_ACTIONS if self.is_legal_move(action)]
+        moves = {True: self.line_moves(True), False: self.line_moves(False)}
+        return [action for action in PLAYER_ACTIONS if moves[DIRECTION_LINES[action][0]] & DIRECTION_LINES[action][1]]
+
+    def iter_successors(self):
+        """
+        Lazily yields (action, next game state) for each legal action.
+        """
+        for action in self.get_legal_moves():
+            successor = self.copy()
+            successor.make_move(action)
+            yield (action, successor)
 
     def get_possible_successors(self) -> list:
         """
         Return a list of possible next game states.
         """
-        successors = []
-        for action in PLAYER_ACTIONS:
-            copy = self.copy()
-            if copy.make_move(action): successors.append(copy)
-        return successors
\ No newline at end of file
+        return [successor for action, successor in self.iter_successors()]
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Game records, stored one game per line as compact JSON:
+
+    {"seed": 12, "board": 4097, "moves": "ldlu", "spawns": [3, 22, -1, 8],
+     "times": [41, 38, 40, 39], "score": 8, "highest": 4}
+
+board is the starting board packed as in GameBoard.pack. moves has one letter
+per move (u, d, l or r). spawns holds the cell (GRID_SIZE * row + col) of the
+tile added after each move, plus 16 if that tile was a 4, or -1 if the move
+changed nothing. times holds the microseconds the agent took to choose each
+move. The spawns make a replay exact even for games played without a seed.
+"""
+import json
+from GameBoard import GRID_SIZE, BASE_NUMBER, PLAYER_ACTIONS
+from BitBoard import BitBoard
+
+MOVE_CODES = {action: action[0] for action in PLAYER_ACTIONS}
+CODE_MOVES = {code: action for action, code in MOVE_CODES.items()}
+FOUR_SPAWN = GRID_SIZE * GRID_SIZE
+NO_SPAWN = -1
+
+class GameRecord():
+    """
+    The moves, spawns and timings of one game, filled in by play_with_agent.
+    """
+    def __init__(self, seed = None, board = 0, moves = '', spawns = None, times = None, score = None, highest = None) -> None:
+        self.seed = seed
+        self.board = board
+        self.moves = list(moves)
+        self.spawns = [] if spawns is None else spawns
+        self.times = [] if times is None else times
+        self.score = score
+        self.highest = highest
+
+    def __len__(self):
+        return len(self.moves)
+
+    def start(self, board) -> None:
+        self.board = board.pack()
+
+    def add_move(self, action, spawn, seconds) -> None:
+        """
+        Records a move, the (row, col, tile) it spawned or None, and the seconds taken to choose it.
+        """
+        self.moves.append(MOVE_CODES[action])
+        if spawn is None:
+            self.spawns.append(NO_SPAWN)
+        else:
+            row, col, tile = spawn
+            self.spawns.append(GRID_SIZE * row + col + (FOUR_SPAWN if tile != BASE_NUMBER else 0))
+        self.times.append(round(seconds * 1e6))
+
+    def finish(self, board) -> None:
+        self.score = board.score
+        self.highest = max(max(tile or 0 for tile in row) for row in board.spaces)
+
+    def to_json(self) -> str:
+        return json.dumps({'seed': self.seed, 'board': self.board, 'moves': ''.join(self.moves), 'spawns': self.spawns,
+            'times': self.times, 'score': self.score, 'highest': self.highest}, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, line):
+        return cls(**json.loads(line))
+
+    def initial_board(self, board_class = BitBoard):
+        board = board_class(False)
+        for cell in range(GRID_SIZE * GRID_SIZE):
+            exponent = (self.board >> (4 * cell)) & 0xF
+            if exponent:
+                board.set_tile(*divmod(cell, GRID_SIZE), 1 << exponent)
+        return board
+
+    def replay(self, board_class = BitBoard):
+        """
+        Yields (board, action) for the board before every move, then (final board, None).
+            Boards are built one move at a time and each yielded board is a separate copy.
+        """
+        board = self.initial_board(board_class)
+        for code, spawn in zip(self.moves, self.spawns):
+            action = CODE_MOVES[code]
+            yield (board.copy(), action)
+            board.make_move(action)
+            if spawn != NO_SPAWN:
+                cell = spawn % FOUR_SPAWN
+                board.set_tile(*divmod(cell, GRID_SIZE), BASE_NUMBER * 2 if spawn >= FOUR_SPAWN else BASE_NUMBER)
+        yield (board, None)
+
+class GameRecorder():
+    """
+    Appends game records to a file through a large write buffer, so recording
+        costs little more than building each game's line.
+    """
+    def __init__(self, path, buffer_size = 1 << 20) -> None:
+        self.path = path
+        self.file = open(path, 'a', buffering=buffer_size)
+        self.games = 0
+
+    def write(self, record) -> None:
+        self.file.write(record.to_json() + '\n')
+        self.games += 1
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def read_records(path):
+    """
+    Yields the GameRecords in a file one at a time, without reading the whole file.
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield GameRecord.from_json(line)
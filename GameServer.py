@@ -0,0 +1,267 @@
+"""
+Local game service hosting many concurrent 2048 sessions over TCP.
+
+Clients send one JSON request per line and get one JSON response per line,
+carrying the request's "id" back so requests can be pipelined:
+
+    {"id": 1, "op": "new", "agent": "corners", "params": {"max_depth": 3}}
+    {"id": 1, "session": 1, "board": [[2, null, null, null], ...], "score": 0, "over": false}
+
+    {"id": 2, "op": "move", "session": 1, "move": "left"}   # a player's move
+    {"id": 3, "op": "agent", "session": 1}                 # the session's agent moves
+    {"id": 4, "op": "state", "session": 1}
+    {"id": 5, "op": "close", "session": 1}
+    {"id": 6, "op": "stats"}                               # latency per op
+
+Move responses add "move" and "moved" (false if the move changed nothing).
+Errors are returned as {"id": ..., "error": "..."}. Sessions belong to the
+connection that opened them and end with it. Agent searches run in a process
+pool, so a slow search never holds up other sessions.
+
+Sessions can play the agents in SERVER_AGENTS with the constructor parameters
+listed there. Each session has its own agent, which goes to a pool worker
+with every move it makes and comes back with whatever state the move changed.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from BitBoard import BitBoard
+from GameBoard import PLAYER_ACTIONS
+from main import make_agent
+
+def positive_int(limit):
+    return lambda value: type(value) is int and 1 <= value <= limit
+
+SEARCH_PARAMS = {
+    'max_depth': positive_int(6),
+    'prob_cutoff': lambda value: type(value) in (int, float) and 0 <= value <= 1,
+    'max_spawn_cells': lambda value: value is None or positive_int(16)(value),
+    'pruning': lambda value: type(value) is bool,
+    'node_budget': lambda value: value is None or positive_int(100000)(value),
+    'time_limit': lambda value: value is None or (type(value) in (int, float) and 0 < value <= 10),
+}
+
+# agent name (as in main.AGENTS) -> {parameter: check its value must pass}
+SERVER_AGENTS = {
+    'random': {},
+    'down': {},
+    'left-down': {},
+    'expectimax': SEARCH_PARAMS,
+    'corners': SEARCH_PARAMS,
+    'smooth-empty-corners': SEARCH_PARAMS,
+}
+
+def agent_move_worker(agent, packed, score):
+    """
+    Returns the agent's move for a packed board, and the agent as the move left it.
+    """
+    return (agent.get_move(BitBoard.from_packed(packed, score)), agent)
+
+class RequestError(Exception):
+    pass
+
+class LatencyStats():
+    """
+    Request latencies per op, keeping the most recent window of them for percentiles.
+    """
+    def __init__(self, window = 10000) -> None:
+        self.window = window
+        self.counts = {}
+        self.latencies = {}
+
+    def add(self, op, seconds) -> None:
+        self.counts[op] = self.counts.get(op, 0) + 1
+        if op not in self.latencies:
+            self.latencies[op] = deque(maxlen=self.window)
+        self.latencies[op].append(seconds)
+
+    def summary(self) -> dict:
+        """
+        Returns {op: {count, mean_ms, p50_ms, p99_ms, max_ms}} over the recent window.
+        """
+        summary = {}
+        for op, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            summary[op] = {
+                'count': self.counts[op],
+                'mean_ms': round(statistics.fmean(ordered) * 1e3, 3),
+                'p50_ms': round(ordered[len(ordered) // 2] * 1e3, 3),
+                'p99_ms': round(ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] * 1e3, 3),
+                'max_ms': round(ordered[-1] * 1e3, 3),
+            }
+        return summary
+
+class Session():
+    def __init__(self, agent = None) -> None:
+        self.board = BitBoard()
+        self.agent = agent
+        self.lock = asyncio.Lock()
+
+    def state(self) -> dict:
+        return {'board': self.board.spaces, 'score': self.board.score, 'over': not self.board.has_moves()}
+
+    def play(self, action) -> bool:
+        if not self.board.has_moves():
+            raise RequestError("game is over")
+        moved = self.board.make_move(action)
+        if moved:
+            self.board.add_random_tile()
+        return moved
+
+class GameServer():
+    """
+    Serves game sessions to any number of connections, sending agent moves to a pool of worker processes.
+    """
+    def __init__(self, workers = None, max_sessions = 100000) -> None:
+        self.workers = workers
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.stats = LatencyStats()
+        self.pool = None
+
+    async def serve(self, host = '127.0.0.1', port = 2048) -> None:
+        self.pool = ProcessPoolExecutor(self.workers)
+        try:
+            server = await asyncio.start_server(self.handle_connection, host, port, limit=1 << 16)
+            async with server:
+                print("Serving 2048 on", ', '.join(str(sock.getsockname()[:2]) for sock in server.sockets))
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    async def handle_connection(self, reader, writer) -> None:
+        owned = set()
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    # each request runs as its own task, so one slow search doesn't block the connection's other sessions
+                    task = asyncio.create_task(self.respond(line, owned, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            for session_id in owned:
+                self.sessions.pop(session_id, None)
+            writer.close()
+
+    async def respond(self, line, owned, writer) -> None:
+        start = perf_counter()
+        request_id = None
+        op = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e: # also raised for lines that aren't UTF-8
+                raise RequestError(f"invalid JSON: {e}")
+            if not isinstance(request, dict):
+                raise RequestError("request must be a JSON object")
+            request_id = request.get('id')
+            op = request.get('op')
+            response = await self.handle(op, request, owned)
+        except RequestError as e:
+            response = {'error': str(e)}
+        except Exception as e:
+            # an agent or worker that fails only fails its own request
+            response = {'error': f"{type(e).__name__}: {e}"}
+        try:
+            if not writer.is_closing():
+                writer.write(json.dumps({'id': request_id, **response}).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.stats.add(op if op in OPS else 'invalid', perf_counter() - start)
+
+    def session(self, request, owned) -> Session:
+        session_id = request.get('session')
+        if not isinstance(session_id, int) or session_id not in owned:
+            raise RequestError(f"no session {session_id!r} on this connection")
+        return self.sessions[session_id]
+
+    async def handle(self, op, request, owned) -> dict:
+        if op == 'new':
+            return self.new_session(request, owned)
+        if op == 'stats':
+            return {'sessions': len(self.sessions), 'latency': self.stats.summary()}
+        if op not in OPS:
+            raise RequestError(f"unknown op {op!r}")
+        session_id = request.get('session')
+        session = self.session(request, owned)
+        async with session.lock:
+            if session_id not in owned:
+                raise RequestError(f"session {session_id!r} was closed")
+            if op == 'state':
+                return {'session': session_id, **session.state()}
+            if op == 'close':
+                owned.discard(session_id)
+                del self.sessions[session_id]
+                return {'session': session_id, 'closed': True}
+            if op == 'move':
+                action = request.get('move')
+                if action not in PLAYER_ACTIONS:
+                    raise RequestError(f"move must be one of {', '.join(PLAYER_ACTIONS)}")
+            else:
+                if session.agent is None:
+                    raise RequestError("session has no agent")
+                if not session.board.has_moves():
+                    raise RequestError("game is over")
+                action, session.agent = await asyncio.get_running_loop().run_in_executor(self.pool, agent_move_worker,
+                    session.agent, session.board.pack(), session.board.score)
+            moved = session.play(action)
+            return {'session': session_id, 'move': action, 'moved': moved, **session.state()}
+
+    def new_session(self, request, owned) -> dict:
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError("too many sessions")
+        name = request.get('agent')
+        agent = None if name is None else self.make_session_agent(name, request.get('params') or {})
+        session_id = next(self.session_ids)
+        self.sessions[session_id] = session = Session(agent)
+        owned.add(session_id)
+        return {'session': session_id, **session.state()}
+
+    def make_session_agent(self, name, params):
+        """
+        Builds a new game's agent, after checking the agent and its params are ones the server allows.
+        """
+        if not isinstance(name, str) or name not in SERVER_AGENTS:
+            raise RequestError(f"unknown agent {name!r}, expected one of {', '.join(SERVER_AGENTS)}")
+        if not isinstance(params, dict):
+            raise RequestError("params must be an object")
+        allowed = SERVER_AGENTS[name]
+        for param, value in params.items():
+            if param not in allowed:
+                raise RequestError(f"{name} does not take {param!r}")
+            if not allowed[param](value):
+                raise RequestError(f"bad value for {param}: {value!r}")
+        agent = make_agent(name, params)
+        agent.reset()
+        return agent
+
+OPS = ('new', 'move', 'agent', 'state', 'close', 'stats')
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Serve 2048 game sessions over line-delimited JSON on TCP.")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=2048, help="port to listen on (default: 2048)")
+    parser.add_argument('-w', '--workers', type=int, help="processes running agent searches (default: one per CPU)")
+    parser.add_argument('--max-sessions', type=int, default=100000, help="open sessions allowed at once")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(GameServer(args.workers, args.max_sessions).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
-from GameAgent import GameAgent, play_n_times
+from GameAgent import GameAgent
 
 class LeftDownAgent(GameAgent):
   def __init__(self) -> None:
     self.left = True
 
+  def reset(self):
+    self.left = True
+
   def get_move(self, board):
     if self.left:
       self.left = False
@@ -20,5 +23,3 @@ class LeftDownAgent(GameAgent):
       return "up"
     self.left = True
     return "right"
-
-play_n_times(LeftDownAgent(), 1000)
\ No newline at end of file
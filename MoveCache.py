@@ -0,0 +1,73 @@
+import sqlite3
+from Symmetry import canonical_form, transform_action, untransform_action
+
+class MoveCache():
+    """
+    Persistent cache of searched moves in an SQLite file, shared by every game,
+        process and run that uses the same file. Entries are keyed by the
+        board's canonical symmetric form, its score, the agent configuration
+        and the search depth, and hold the move (in the canonical frame) and
+        its value. With canonical False boards are keyed as they are, for
+        searches whose moves aren't symmetric. The connection opens on first
+        use, so a pickled cache reconnects in each worker process.
+    """
+    def __init__(self, path, config = '', canonical = True) -> None:
+        self.path = path
+        self.config = config
+        self.canonical = canonical
+        self.connection = None
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS moves (
+                board INTEGER NOT NULL, score INTEGER NOT NULL, config TEXT NOT NULL, depth INTEGER NOT NULL,
+                move TEXT NOT NULL, value REAL NOT NULL, PRIMARY KEY (board, score, config, depth)) WITHOUT ROWID''')
+        return self.connection
+
+    def key(self, board):
+        """
+        Returns the canonical board as a signed 64-bit integer (as SQLite stores it) and the transform giving it.
+        """
+        key, symmetry = canonical_form(board.pack()) if self.canonical else (board.pack(), 0)
+        if key >= 1 << 63:
+            key -= 1 << 64
+        return key, symmetry
+
+    def get(self, board, depth):
+        """
+        Returns the cached (move, value) for the board searched at this depth, or None.
+        """
+        key, symmetry = self.key(board)
+        row = self.connect().execute('SELECT move, value FROM moves WHERE board = ? AND score = ? AND config = ? AND depth = ?',
+            (key, board.score, self.config, depth)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return (untransform_action(row[0], symmetry), row[1])
+
+    def put(self, board, depth, move, value) -> None:
+        key, symmetry = self.key(board)
+        self.connect().execute('INSERT OR REPLACE INTO moves VALUES (?, ?, ?, ?, ?, ?)',
+            (key, board.score, self.config, depth, transform_action(move, symmetry), value))
+
+    def __len__(self):
+        return self.connect().execute('SELECT COUNT(*) FROM moves').fetchone()[0]
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['connection'] = None
+        return state
+
+    def __repr__(self):
+        return f"MoveCache({self.path}, {self.hits} hits, {self.misses} misses)"
@@ -0,0 +1,73 @@
+import numpy as np
+from Symmetry import symmetries
+from PerfTimer import perf_timer
+
+# cells are numbered 4 * row + col
+DEFAULT_TUPLES = [
+    (0, 1, 2, 3), # outer row
+    (4, 5, 6, 7), # inner row
+    (0, 1, 4, 5), # corner square
+    (1, 2, 5, 6), # edge square
+    (5, 6, 9, 10), # centre square
+]
+
+class NTupleNetwork():
+    """
+    Value function over packed boards: a sum of lookup-table weights, one table
+        per tuple of cells, indexed by the exponents in those cells. Every tuple
+        is read from all 8 symmetric forms of the board, so a tuple learns the
+        same pattern wherever it appears. All tables share one flat float32
+        array, which can be saved and memory-mapped.
+    """
+    def __init__(self, tuples = DEFAULT_TUPLES, weights = None) -> None:
+        self.tuples = [tuple(cells) for cells in tuples]
+        self.offsets = []
+        size = 0
+        for cells in self.tuples:
+            self.offsets.append(size)
+            size += 16 ** len(cells)
+        if weights is None:
+            weights = np.zeros(size, dtype=np.float32)
+        elif len(weights) != size:
+            raise ValueError(f"Expected {size} weights for these tuples, got {len(weights)}")
+        self.weights = weights
+        # (offset, [(cell shift, index shift)]) for each tuple
+        self.layout = [(offset, [(4 * cell, 4 * k) for k, cell in enumerate(cells)]) for offset, cells in zip(self.offsets, self.tuples)]
+
+    def indexes(self, board) -> list:
+        """
+        Returns the flat weight index of every tuple in every symmetric form of the board.
+        """
+        indexes = []
+        for form in symmetries(board):
+            for offset, shifts in self.layout:
+                pattern = 0
+                for cell_shift, index_shift in shifts:
+                    pattern |= ((form >> cell_shift) & 0xF) << index_shift
+                indexes.append(offset + pattern)
+        return indexes
+
+    def value(self, board, indexes = None) -> float:
+        if indexes is None:
+            indexes = self.indexes(board)
+        return float(self.weights[indexes].sum())
+
+    @perf_timer.counted('ntuple.updates')
+    def update(self, board, delta, indexes = None) -> None:
+        """
+        Adds delta to every weight the board reads.
+        """
+        if indexes is None:
+            indexes = self.indexes(board)
+        np.add.at(self.weights, indexes, delta)
+
+    def save(self, path) -> None:
+        np.save(path, self.weights)
+
+    @classmethod
+    def load(cls, path, tuples = DEFAULT_TUPLES, mmap_mode = None):
+        """
+        Loads weights written by save for the same tuples. With a mmap_mode
+            (see numpy.load) the weights are memory-mapped rather than read.
+        """
+        return cls(tuples, np.load(path, mmap_mode=mmap_mode))
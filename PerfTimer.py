@@ -1,11 +1,133 @@
+import os
 import time
+from contextlib import nullcontext
+from functools import wraps
+
+class Timing():
+  """
+  Context manager adding the time spent in its block to a PerfTimer timer.
+  """
+  def __init__(self, perf_timer, name) -> None:
+    self.perf_timer = perf_timer
+    self.name = name
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+  def __exit__(self, *exc):
+    self.perf_timer.add_time(self.name, time.perf_counter() - self.start)
+    return False
 
 class PerfTimer():
-  def __init__(self) -> None:
+  """
+  Named counters and timers for the hot paths, collected per game and per run.
+  Each stat is a [count, seconds] pair; counters only use the count.
+  When disabled (the default, unless the PERF_TIMER environment variable is
+  set to something other than 0) the decorators return functions unchanged,
+  so instrumented code costs nothing. The decorators look at enabled when
+  they are applied, so it must be set before the instrumented modules are imported.
+  """
+  def __init__(self, enabled = None) -> None:
     self.timer = []
+    if enabled is None:
+      enabled = os.environ.get('PERF_TIMER', '0') not in ('', '0')
+    self.enabled = enabled
+    self.game_stats = {}
+    self.run_stats = {}
   def init(self):
     self.timer.append(time.perf_counter())
   def log(self, title = 'log'):
     print(title + ':', time.perf_counter() - self.timer.pop())
 
-perf_timer = PerfTimer()
\ No newline at end of file
+  def count(self, name, n = 1):
+    stat = self.game_stats.get(name)
+    if stat is None:
+      stat = self.game_stats[name] = [0, 0.0]
+    stat[0] += n
+
+  def add_time(self, name, seconds, calls = 1):
+    stat = self.game_stats.get(name)
+    if stat is None:
+      stat = self.game_stats[name] = [0, 0.0]
+    stat[0] += calls
+    stat[1] += seconds
+
+  def time(self, name):
+    """
+    Returns a context manager timing its block under the name, or one that does nothing when disabled.
+    """
+    if not self.enabled:
+      return nullcontext()
+    return Timing(self, name)
+
+  def timed(self, name = None):
+    """
+    Decorator timing every call of the function under the name (default: its qualified name).
+    """
+    def decorate(func):
+      if not self.enabled:
+        return func
+      stat_name = name or func.__qualname__
+      @wraps(func)
+      def timed_func(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+          return func(*args, **kwargs)
+        finally:
+          self.add_time(stat_name, time.perf_counter() - start)
+      return timed_func
+    return decorate
+
+  def counted(self, name = None, key = None):
+    """
+    Decorator counting calls of the function under the name (default: its
+    qualified name), or under key(*args, **kwargs) when a key function is given.
+    """
+    def decorate(func):
+      if not self.enabled:
+        return func
+      stat_name = name or func.__qualname__
+      @wraps(func)
+      def counted_func(*args, **kwargs):
+        self.count(stat_name if key is None else key(*args, **kwargs))
+        return func(*args, **kwargs)
+      return counted_func
+    return decorate
+
+  def end_game(self) -> dict:
+    """
+    Adds the current game's stats to the run's and returns them, starting a new game.
+    """
+    stats = self.game_stats
+    self.merge(stats)
+    self.game_stats = {}
+    return stats
+
+  def merge(self, stats):
+    """
+    Adds stats collected elsewhere (such as in a worker process) to the run's.
+    """
+    for name, (count, seconds) in stats.items():
+      stat = self.run_stats.get(name)
+      if stat is None:
+        stat = self.run_stats[name] = [0, 0.0]
+      stat[0] += count
+      stat[1] += seconds
+
+  def reset(self):
+    self.game_stats = {}
+    self.run_stats = {}
+
+  def report(self, stats = None, title = 'Run'):
+    """
+    Prints each stat's count and, for timers, total and mean time. Defaults to the run's stats.
+    """
+    if stats is None:
+      stats = self.run_stats
+    print(title, "performance:")
+    for name, (count, seconds) in sorted(stats.items()):
+      if seconds:
+        print(f"  {name:40} {count:12,} calls {seconds:10.3f} s {seconds / count * 1e6:10.1f} us/call")
+      else:
+        print(f"  {name:40} {count:12,}")
+
+perf_timer = PerfTimer()
@@ -1,16 +1,68 @@
+import os
+import json
+import shutil
 import random
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import statistics
 import math
-from GameAgent import GameAgent, play_n_times, play_with_agent
-from GameBoard import GRID_SIZE, PLAYER_ACTIONS, GameBoard
+import numpy as np
+from GameAgent import GameAgent, game_seeds
+from GameBoard import GRID_SIZE, PLAYER_ACTIONS
+from BitBoard import BitBoard
+from QTable import QTable
+from Symmetry import transform_action
+from NTupleNetwork import NTupleNetwork, DEFAULT_TUPLES
 from PerfTimer import perf_timer
 
+training_agent = None # agent used by the training pool workers
+training_snapshot = None # snapshot the worker's agent last loaded
+
+def init_training_worker(agent):
+  global training_agent
+  training_agent = agent
+
+def training_episode_worker(snapshot, seed):
+  """
+  Plays one episode with the weights of the given snapshot, loading it only if it is new.
+  """
+  global training_snapshot
+  if snapshot != training_snapshot:
+    training_agent.load(snapshot)
+    training_snapshot = snapshot
+  random.seed(seed)
+  return training_agent.generate_episode()
+
 class QLearningAgent(GameAgent):
-  def __init__(self, learning_rate, discount, epsilon) -> None:
+  board_class = BitBoard # training board backend, its packed form is the table key
+
+  def __init__(self, learning_rate, discount, epsilon, max_states = None, canonical = False) -> None:
+    """
+    max_states caps how many board states the Q-table stores.
+    canonical stores rotations and reflections of a board as one state.
+    """
     self.learning_rate = learning_rate
     self.discount = discount
     self.epsilon = epsilon
-    self.q_vals = {}
+    self.canonical = canonical
+    self.q_vals = self.make_table(max_states)
+    self.episodes_trained = 0
+
+  def make_table(self, max_states):
+    """
+    Returns the Q-table, or None for subclasses that learn some other model.
+    """
+    return QTable(max_states=max_states)
+
+  def q_key(self, board, action):
+    """
+    Returns the Q-table key and action for a board and action.
+    """
+    if not self.canonical:
+      return board.pack(), action
+    key, symmetry = board.canonical()
+    return key, transform_action(action, symmetry)
 
   def get_move(self, board):
     legal_moves = board.get_legal_moves()
@@ -23,12 +75,20 @@ class QLearningAgent(GameAgent):
         best_val = val
     return best_action
 
+  def q_inputs(self, board, action):
+    """
+    Returns what the model reads to value an action on a board: here its Q-table key.
+    """
+    return self.q_key(board, action)
+
+  def q_from_inputs(self, inputs):
+    return self.q_vals.get(*inputs)
+
+  def update_from_inputs(self, inputs, error):
+    self.q_vals.set(*inputs, self.q_from_inputs(inputs) + self.learning_rate*error)
+
   def get_q(self, board, action):
-    hashed_board = board.hash_board()
-    if ((hashed_board, action) in self.q_vals):
-      return self.q_vals[hashed_board, action]
-    else:
-      return 0
+    return self.q_from_inputs(self.q_inputs(board, action))
 
   def get_action(self, board):
     legal_moves = board.get_legal_moves()
@@ -37,11 +97,13 @@ class QLearningAgent(GameAgent):
     else:
       return self.get_move(board)
 
+  @perf_timer.counted('qlearning.updates')
   def update_q_vals(self, board, action, error):
-    self.q_vals[board.hash_board(), action] = self.get_q(board, action) + self.learning_rate*error
-  
+    self.update_from_inputs(self.q_inputs(board, action), error)
+
+  @perf_timer.timed('qlearning.episode')
   def train(self):
-      board = GameBoard()
+      board = self.board_class()
       while board.has_moves():
         # choose action
         action = self.get_action(board)
@@ -63,80 +125,317 @@ class QLearningAgent(GameAgent):
       highestTile = max(map(max, board.spaces))
       return (board.score, highestTile)
 
-  def train_n_times(self, episodes = 100):
+  def generate_episode(self):
+    """
+    Plays one episode without learning. Returns the transitions learn_episode
+    needs, with every board already reduced to model inputs, then the score
+    and highest tile.
+    """
+    board = self.board_class()
+    transitions = []
+    while board.has_moves():
+      action = self.get_action(board)
+      inputs = self.q_inputs(board, action)
+      prev_score = board.score
+      if board.make_move(action):
+        board.add_random_tile()
+      reward = board.score - prev_score
+      if reward > 0:
+        reward = math.log(reward, 2)
+      transitions.append((inputs, reward, [self.q_inputs(board, next_action) for next_action in PLAYER_ACTIONS]))
+    highestTile = max(map(max, board.spaces))
+    return (transitions, board.score, highestTile)
+
+  def learn_episode(self, transitions):
+    """
+    Applies the Q-learning updates for an episode from generate_episode.
+    """
+    for inputs, reward, next_inputs in transitions:
+      next_q = max([self.q_from_inputs(next_action_inputs) for next_action_inputs in next_inputs])
+      error = reward + self.discount*next_q - self.q_from_inputs(inputs)
+      self.update_from_inputs(inputs, error)
+
+  def train_parallel(self, episodes, workers, sync_interval = 10, seed = None):
+    """
+    Trains with worker processes generating episodes and this process learning
+    from them, yielding (score, highest tile) as each episode is learned.
+    Every sync_interval episodes the model is saved as a snapshot that
+    workers memory-map for their next episodes, so actors are at most about
+    sync_interval + 2 * workers episodes behind the learner. Episodes are
+    learned in order and seeded from seed, so a seeded run is repeatable.
+    """
+    if seed is None:
+      seed = random.randrange(2**32)
+    seeds = game_seeds(seed, episodes)
+    snapshot_root = tempfile.mkdtemp(prefix='snapshots-')
+    users = {} # snapshot -> episodes in flight that use it
+    snapshot = None
+    try:
+      with ProcessPoolExecutor(workers, initializer=init_training_worker, initargs=(self,)) as pool:
+        pending = deque()
+        for i in range(episodes):
+          if i % sync_interval == 0:
+            snapshot = os.path.join(snapshot_root, f"episode-{i:09d}")
+            self.save(snapshot)
+            users[snapshot] = 0
+          users[snapshot] += 1
+          pending.append((snapshot, pool.submit(training_episode_worker, snapshot, seeds[i])))
+          # keep two episodes per worker in flight, then drain at the end
+          while len(pending) >= 2 * workers or (pending and i == episodes - 1):
+            used, future = pending.popleft()
+            transitions, score, highestTile = future.result()
+            self.learn_episode(transitions)
+            users[used] -= 1
+            if users[used] == 0 and used != snapshot:
+              del users[used]
+              shutil.rmtree(used, ignore_errors=True)
+            yield (score, highestTile)
+    finally:
+      shutil.rmtree(snapshot_root, ignore_errors=True)
+
+  def train_n_times(self, episodes = 100, checkpoint_dir = None, checkpoint_every = 100, workers = 1, sync_interval = 10, seed = None):
+    """
+    Trains for the given number of episodes. With a checkpoint_dir, training
+    resumes from the latest checkpoint there (counting its episodes towards
+    the total) and a new checkpoint is saved every checkpoint_every episodes
+    and at the end. With more than one worker, episodes are generated by a
+    process pool (see train_parallel).
+    """
+    if checkpoint_dir is not None:
+      latest = latest_checkpoint(checkpoint_dir)
+      if latest is not None:
+        self.load(latest)
+        print("Resuming training from episode", self.episodes_trained)
+      episodes -= self.episodes_trained
     scores = []
     highestTiles = []
-    for i in range(episodes):
-      score, highestTile = self.train()
+    if workers > 1:
+      results = self.train_parallel(episodes, workers, sync_interval, seed)
+    else:
+      results = (self.train() for i in range(episodes))
+    for i, (score, highestTile) in enumerate(results):
+      self.episodes_trained += 1
       scores.append(score)
       highestTiles.append(highestTile)
+      if checkpoint_dir is not None and (self.episodes_trained % checkpoint_every == 0 or i == episodes - 1):
+        self.checkpoint(checkpoint_dir)
+    if perf_timer.enabled:
+      perf_timer.report(perf_timer.end_game(), 'Training')
+    if not scores:
+      return
     avgScore = sum(scores) / len(scores)
     print("Average score after training for", episodes, "games:", avgScore)
     print("Highest tile attained after training:", max(highestTiles))
-    print("Median highest tile after training:", statistics.median(highestTiles))      
+    print("Median highest tile after training:", statistics.median(highestTiles))
+    self.print_model()
+
+  def print_model(self):
+    print("Q-table:", self.q_vals)
+
+  def save(self, directory):
+    """
+    Saves the learned model and the number of episodes trained into the directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    self.save_model(directory)
+    with open(os.path.join(directory, 'agent.json'), 'w') as f:
+      json.dump({'agent': type(self).__name__, 'episodes_trained': self.episodes_trained}, f)
+
+  def load(self, directory, mmap = True):
+    """
+    Loads a model saved by the same kind of agent. With mmap, large arrays are
+    memory-mapped copy-on-write instead of read into memory.
+    """
+    with open(os.path.join(directory, 'agent.json')) as f:
+      info = json.load(f)
+    if info['agent'] != type(self).__name__:
+      raise ValueError(f"{directory} holds a {info['agent']}, not a {type(self).__name__}")
+    self.load_model(directory, mmap)
+    self.episodes_trained = info['episodes_trained']
+
+  def save_model(self, directory):
+    self.q_vals.save(directory)
+
+  def load_model(self, directory, mmap):
+    self.q_vals.load(directory, mmap)
+
+  def checkpoint(self, checkpoint_dir):
+    """
+    Saves a new checkpoint under checkpoint_dir, then points its 'latest' file
+    at it and removes the previous one, so a crash never leaves a partial checkpoint as latest.
+    """
+    name = f"episode-{self.episodes_trained:09d}"
+    self.save(os.path.join(checkpoint_dir, name))
+    previous = latest_checkpoint(checkpoint_dir)
+    latest_path = os.path.join(checkpoint_dir, 'latest')
+    with open(latest_path + '.tmp', 'w') as f:
+      f.write(name)
+    os.replace(latest_path + '.tmp', latest_path)
+    if previous is not None and os.path.basename(previous) != name:
+      shutil.rmtree(previous, ignore_errors=True)
 
 class ApproximateQLearningAgent(QLearningAgent):
   def __init__(self, learning_rate, discount, epsilon) -> None:
     super().__init__(learning_rate, discount, epsilon)
-    self.features = [blank_feature, highest_tile_feature, sum_tiles_feature, corner_tile_feature]
-    self.weights = [0]*len(self.features)
+    self.weights = np.zeros(len(FEATURE_NAMES))
+    self.feature_cache = {} # board hash -> {action: feature vector}, for the last two boards seen
 
-  def get_q(self, board, action):
-    total = 0
-    for i, feature in enumerate(self.features):
-      total += (self.weights[i] * feature(board, action))
-    return total
+  def make_table(self, max_states):
+    return None
 
-  def update_q_vals(self, board, action, error):
-    for i, feature in enumerate(self.features):
-      self.weights[i] += self.learning_rate*error*feature(board, action)
+  def get_feature_vector(self, board, action):
+    """
+    Returns the features of the board after the action, computing the
+    afterstate once per board and action. A training step only looks at the
+    boards before and after its move, so only the last two boards are kept.
+    """
+    key = board.hash_board()
+    board_features = self.feature_cache.get(key)
+    if board_features is None:
+      if len(self.feature_cache) >= 2:
+        del self.feature_cache[next(iter(self.feature_cache))]
+      board_features = self.feature_cache[key] = {}
+    vector = board_features.get(action)
+    if vector is None:
+      vector = board_features[action] = extract_features(new_board(board, action))
+    return vector
+
+  def q_inputs(self, board, action):
+    return self.get_feature_vector(board, action)
+
+  def q_from_inputs(self, inputs):
+    return float(self.weights @ inputs)
+
+  def update_from_inputs(self, inputs, error):
+    self.weights += self.learning_rate*error*inputs
+
+  def save_model(self, directory):
+    np.save(os.path.join(directory, 'weights.npy'), self.weights)
+
+  def load_model(self, directory, mmap):
+    self.weights = np.load(os.path.join(directory, 'weights.npy'))
 
-  def train_n_times(self, episodes = 100):
-    super().train_n_times(episodes)
+  def print_model(self):
     print('Feature weights:')
-    for i, feature in enumerate(self.features):
-      print(feature.__name__ + ':', self.weights[i])
+    for name, weight in zip(FEATURE_NAMES, self.weights):
+      print(name + ':', weight)
 
+class NTupleQLearningAgent(QLearningAgent):
+  """
+  Learns the value of afterstates (the board after a move, before the new tile)
+  with an n-tuple network trained by TD(0). The value of an action is the score
+  it gains plus the value of its afterstate. Rewards are raw score gains.
+  """
+  def __init__(self, learning_rate = 0.0025, discount = 1.0, epsilon = 0, tuples = DEFAULT_TUPLES) -> None:
+    super().__init__(learning_rate, discount, epsilon)
+    self.network = NTupleNetwork(tuples)
+
+  def make_table(self, max_states):
+    return None
+
+  def get_q(self, board, action):
+    after = board.copy()
+    after.make_move(action)
+    return after.score - board.score + self.network.value(after.pack())
+
+  @perf_timer.timed('qlearning.episode')
+  def train(self):
+      board = self.board_class()
+      prev_indexes = None
+      while board.has_moves():
+        action = self.get_action(board)
+        after = board.copy()
+        after.make_move(action)
+        reward = after.score - board.score
+        indexes = self.network.indexes(after.pack())
+
+        # move the previous afterstate's value towards this step's reward plus afterstate value
+        if prev_indexes is not None:
+          error = reward + self.discount*self.network.value(None, indexes) - self.network.value(None, prev_indexes)
+          self.network.update(None, self.learning_rate*error, prev_indexes)
+        prev_indexes = indexes
+
+        board = after
+        board.add_random_tile()
+
+      # nothing follows the last afterstate
+      if prev_indexes is not None:
+        self.network.update(None, -self.learning_rate*self.network.value(None, prev_indexes), prev_indexes)
+      highestTile = max(map(max, board.spaces))
+      return (board.score, highestTile)
+
+  def generate_episode(self):
+    """
+    Plays one episode without learning, returning each step's reward and
+    afterstate weight indexes, then the score and highest tile.
+    """
+    board = self.board_class()
+    transitions = []
+    while board.has_moves():
+      action = self.get_action(board)
+      after = board.copy()
+      after.make_move(action)
+      transitions.append((after.score - board.score, self.network.indexes(after.pack())))
+      board = after
+      board.add_random_tile()
+    highestTile = max(map(max, board.spaces))
+    return (transitions, board.score, highestTile)
+
+  def learn_episode(self, transitions):
+    prev_indexes = None
+    for reward, indexes in transitions:
+      if prev_indexes is not None:
+        error = reward + self.discount*self.network.value(None, indexes) - self.network.value(None, prev_indexes)
+        self.network.update(None, self.learning_rate*error, prev_indexes)
+      prev_indexes = indexes
+    if prev_indexes is not None:
+      self.network.update(None, -self.learning_rate*self.network.value(None, prev_indexes), prev_indexes)
+
+  def save_model(self, directory):
+    self.network.save(os.path.join(directory, 'ntuple.npy'))
+
+  def load_model(self, directory, mmap):
+    self.network = NTupleNetwork.load(os.path.join(directory, 'ntuple.npy'), self.network.tuples, 'c' if mmap else None)
+
+  def print_model(self):
+    print("N-tuple network:", len(self.network.tuples), "tuples,", len(self.network.weights), "weights")
+
+
+def latest_checkpoint(checkpoint_dir):
+  """
+  Returns the path of the latest checkpoint in checkpoint_dir, or None if there is none.
+  """
+  try:
+    with open(os.path.join(checkpoint_dir, 'latest')) as f:
+      return os.path.join(checkpoint_dir, f.read().strip())
+  except FileNotFoundError:
+    return None
 
 def new_board(board, action):
   new_board = board.copy()
   new_board.make_move(action)
   return new_board
 
-def blank_feature(old_board, action):
-  board = new_board(old_board, action)
-  return len(board.get_blank_spaces())
-
-def sum_tiles_feature(old_board, action):
-  board = new_board(old_board, action)
-  values = set()
-  for row in range(GRID_SIZE):
-      for col in range(GRID_SIZE):
-          tile = board.spaces[row][col]
-          if tile != None: values.add(math.log(tile, 2))
-  return sum(values)
-
-def highest_tile_feature(old_board, action):
-  board = new_board(old_board, action)
-  highestVal = 0
-  for row in range(GRID_SIZE):
-      for col in range(GRID_SIZE):
-          tile = board.spaces[row][col]
-          if tile != None: highestVal = max(highestVal, tile)
-  return math.log(highestVal, 2)
+FEATURE_NAMES = ('blank_feature', 'highest_tile_feature', 'sum_tiles_feature', 'corner_tile_feature')
 
-def corner_tile_feature(old_board, action):
-  board = new_board(old_board, action)
+def extract_features(board):
+  """
+  Computes the features named in FEATURE_NAMES, in that order, of an afterstate
+  in one pass over its cells: the blank count, log2 of the highest tile, the
+  sum of the distinct log2 tile values, and 30 if the highest tile is in a
+  corner or -30 if not.
+  """
+  spaces = board.spaces
+  blanks = 0
   highestVal = 0
+  values = set()
   for row in range(GRID_SIZE):
       for col in range(GRID_SIZE):
-          tile = board.spaces[row][col]
-          if tile != None: highestVal = max(highestVal, tile)
-  if highestVal in [board.spaces[0][0], board.spaces[GRID_SIZE-1][0], board.spaces[0][GRID_SIZE-1], board.spaces[GRID_SIZE-1][GRID_SIZE-1]]:
-    return 30
-  else:
-    return -30
-
-approx_agent = ApproximateQLearningAgent(0.0001, 0.9, 0.9)
-approx_agent.train_n_times(1000)
-play_n_times(approx_agent, 1000)
\ No newline at end of file
+          tile = spaces[row][col]
+          if tile is None:
+            blanks += 1
+          else:
+            highestVal = max(highestVal, tile)
+            values.add(math.log(tile, 2))
+  corners = [spaces[0][0], spaces[GRID_SIZE-1][0], spaces[0][GRID_SIZE-1], spaces[GRID_SIZE-1][GRID_SIZE-1]]
+  return np.array([blanks, math.log(highestVal, 2), sum(values), 30 if highestVal in corners else -30], dtype=float)
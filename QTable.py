@@ -0,0 +1,126 @@
+import os
+import json
+from array import array
+from GameBoard import PLAYER_ACTIONS
+
+ACTION_INDEX = {action: i for i, action in enumerate(PLAYER_ACTIONS)}
+NUM_ACTIONS = len(PLAYER_ACTIONS)
+EMPTY_KEY = 0 # the empty board never occurs in play, so it marks unused slots
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+KEY_MASK = (1 << 64) - 1
+
+class QTable():
+    """
+    Open-addressing hash table from packed board keys to one Q-value per action,
+        stored in flat arrays (8 bytes per key and per value).
+        Once max_states states are stored, new states are no longer added and
+        read as 0. Tables saved with save are .npy files that load can
+        memory-map instead of reading.
+    """
+    def __init__(self, capacity = 1 << 16, max_states = None, max_load = 0.7) -> None:
+        self.max_states = max_states
+        self.max_load = max_load
+        self.allocate(capacity)
+
+    def allocate(self, capacity) -> None:
+        self.bits = capacity.bit_length() - 1
+        self.mask = capacity - 1
+        self.size = 0
+        self.keys = array('Q', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity * NUM_ACTIONS))
+
+    def __len__(self):
+        return self.size
+
+    def capacity(self) -> int:
+        return self.mask + 1
+
+    def memory_bytes(self) -> int:
+        return self.keys.itemsize * len(self.keys) + self.values.itemsize * len(self.values)
+
+    def find_slot(self, key) -> int:
+        """
+        Returns the slot holding the key, or the empty slot where it would go.
+        """
+        slot = ((key * HASH_MULTIPLIER) & KEY_MASK) >> (64 - self.bits)
+        keys = self.keys
+        while True:
+            slot_key = keys[slot]
+            if slot_key == key or slot_key == EMPTY_KEY:
+                return slot
+            slot = (slot + 1) & self.mask
+
+    def get(self, key, action) -> float:
+        slot = self.find_slot(key)
+        if self.keys[slot] == EMPTY_KEY:
+            return 0
+        return self.values[slot * NUM_ACTIONS + ACTION_INDEX[action]]
+
+    def set(self, key, action, value) -> bool:
+        """
+        Stores the value, returning False if the key is new and the table is full.
+        """
+        slot = self.find_slot(key)
+        if self.keys[slot] == EMPTY_KEY:
+            if self.max_states is not None and self.size >= self.max_states:
+                return False
+            if self.size + 1 > self.max_load * self.capacity():
+                self.grow()
+                slot = self.find_slot(key)
+            self.keys[slot] = key
+            self.size += 1
+        self.values[slot * NUM_ACTIONS + ACTION_INDEX[action]] = value
+        return True
+
+    def grow(self) -> None:
+        """
+        Doubles the capacity and reinserts every stored state.
+        """
+        keys, values = self.keys, self.values
+        self.allocate(2 * self.capacity())
+        for old_slot, key in enumerate(keys):
+            if key != EMPTY_KEY:
+                slot = self.find_slot(key)
+                self.keys[slot] = key
+                for i in range(NUM_ACTIONS):
+                    self.values[slot * NUM_ACTIONS + i] = values[old_slot * NUM_ACTIONS + i]
+                self.size += 1
+
+    def save(self, directory) -> None:
+        """
+        Writes the keys and values as q_keys.npy and q_values.npy in the directory,
+            with the state count in q_table.json.
+        """
+        import numpy as np
+        np.save(os.path.join(directory, 'q_keys.npy'), np.frombuffer(self.keys, dtype=np.uint64))
+        np.save(os.path.join(directory, 'q_values.npy'), np.frombuffer(self.values, dtype=np.float64))
+        with open(os.path.join(directory, 'q_table.json'), 'w') as f:
+            json.dump({'size': self.size}, f)
+
+    def load(self, directory, mmap = True) -> None:
+        """
+        Replaces the table with one written by save. With mmap, the files are
+            mapped copy-on-write, so loading is immediate and changes stay in memory.
+        """
+        import numpy as np
+        mmap_mode = 'c' if mmap else None
+        keys = np.load(os.path.join(directory, 'q_keys.npy'), mmap_mode=mmap_mode)
+        values = np.load(os.path.join(directory, 'q_values.npy'), mmap_mode=mmap_mode)
+        if len(values) != NUM_ACTIONS * len(keys) or len(keys) & (len(keys) - 1):
+            raise ValueError(f"{directory} does not hold a saved QTable")
+        self.bits = len(keys).bit_length() - 1
+        self.mask = len(keys) - 1
+        self.keys = memoryview(keys).cast('B').cast('Q')
+        self.values = memoryview(values).cast('B').cast('d')
+        with open(os.path.join(directory, 'q_table.json')) as f:
+            self.size = json.load(f)['size']
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # memory-mapped tables are pickled as plain arrays
+        state['keys'] = array('Q', bytes(self.keys))
+        state['values'] = array('d', bytes(self.values))
+        return state
+
+    def __repr__(self):
+        return f"QTable({self.size} states, {self.memory_bytes() / 2**20:.1f} MiB)"
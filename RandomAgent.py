@@ -1,8 +1,6 @@
 import random
-from GameAgent import GameAgent, play_n_times
+from GameAgent import GameAgent
 
 class RandomAgent(GameAgent):
   def get_move(self, board):
     return random.choice(board.get_legal_moves())
-
-play_n_times(RandomAgent(), 1000)
\ No newline at end of file
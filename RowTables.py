@@ -0,0 +1,217 @@
+import os
+import sys
+import mmap
+import struct
+from array import array
+
+ROW_COUNT = 1 << 16 # every row of four 4-bit exponents
+TABLE_MAGIC = b'2048ROWT'
+TABLE_VERSION = 3
+TABLE_SPECS = [ # (name, array typecode) in file order
+    ('left', 'H'), # packed row after a left shift
+    ('right', 'H'), # packed row after a right shift
+    ('left_score', 'I'), # score gained by a left shift
+    ('right_score', 'I'), # score gained by a right shift
+    ('smoothness', 'H'), # log2 differences between neighbouring tiles, counted from both sides
+    ('blanks', 'B'), # number of blank cells
+    ('max_exponent', 'B'), # largest exponent in the row
+    ('moves', 'B'), # LEFT_CHANGES | RIGHT_CHANGES bits for shifts that change the row
+]
+LEFT_CHANGES = 1
+RIGHT_CHANGES = 2
+TABLE_PATH = os.environ.get('ROW_TABLES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'row_tables.bin'))
+HEADER = struct.Struct('=8sII')
+
+def find_first_left(row_copy, col) -> tuple[int, int]:
+    """
+    Returns a tuple of the value of the first non-empty cell to the left of the given one,
+        and the column index of that cell.
+        Returns None if no cell found.
+    """
+    for i in range(col-1, -1, -1):
+        if row_copy[i] is not None:
+            return (row_copy[i], i)
+    return None
+
+def shift_row_left(tiles):
+    """
+    Given a row of tiles (None or powers of two), perform a left shift on it.
+        Returns the new row, whether anything changed and the score gained.
+    """
+    row_copy = [None] * len(tiles)
+    changed = False
+    score_add = 0
+
+    for col in range(len(tiles)):
+        if tiles[col] is None:
+            continue
+        if col == 0:
+            row_copy[col] = tiles[col]
+            continue
+        first_left = find_first_left(row_copy, col)
+        if first_left is None:
+            changed = True
+            row_copy[0] = tiles[col]
+        elif first_left[0] == tiles[col]:
+            changed = True
+            row_copy[first_left[1]] *= -2
+            score_add += tiles[col] * 2
+        elif first_left[1] < col - 1:
+            changed = True
+            row_copy[first_left[1] + 1] = tiles[col]
+        else:
+            row_copy[col] = tiles[col]
+
+    new_row = [None if tile is None else abs(tile) for tile in row_copy]
+    return new_row, changed, score_add
+
+def shift_row_right(tiles):
+    """
+    Given a row of tiles (None or powers of two), perform a right shift on it.
+    """
+    new_row, changed, score_add = shift_row_left(list(reversed(tiles)))
+    return list(reversed(new_row)), changed, score_add
+
+def unpack_row(packed) -> list:
+    return [None if (packed >> shift) & 0xF == 0 else 1 << ((packed >> shift) & 0xF) for shift in (0, 4, 8, 12)]
+
+def pack_row(tiles) -> int:
+    """
+    Packs a row of tiles (None or powers of two) into a 16-bit integer of log2 exponents.
+    """
+    packed = 0
+    for col, tile in enumerate(tiles):
+        if tile is not None:
+            packed |= (tile.bit_length() - 1) << (4 * col)
+    return packed
+
+def row_entries(packed) -> dict:
+    """
+    Computes every table entry for one packed row.
+    """
+    # 2**15 tiles would merge into something that does not fit in 4 bits, so keep them distinct
+    tiles = [2**(16 + col) if tile == 2**15 else tile for col, tile in enumerate(unpack_row(packed))]
+    left_row, left_changed, left_score = shift_row_left(tiles)
+    right_row, right_changed, right_score = shift_row_right(tiles)
+    exponents = [(packed >> shift) & 0xF for shift in (0, 4, 8, 12)]
+    smoothness = sum(abs(a - b) for a, b in zip(exponents, exponents[1:]) if a and b)
+    return {
+        'left': pack_row(None if tile is None else min(tile, 2**15) for tile in left_row),
+        'right': pack_row(None if tile is None else min(tile, 2**15) for tile in right_row),
+        'left_score': left_score,
+        'right_score': right_score,
+        'smoothness': 2 * smoothness,
+        'blanks': exponents.count(0),
+        'max_exponent': max(exponents),
+        'moves': (LEFT_CHANGES if left_changed else 0) | (RIGHT_CHANGES if right_changed else 0),
+    }
+
+def build_tables() -> dict:
+    """
+    Builds every table in memory as arrays indexed by packed row.
+    """
+    tables = {name: array(typecode, bytes(ROW_COUNT * array(typecode).itemsize)) for name, typecode in TABLE_SPECS}
+    for packed in range(ROW_COUNT):
+        for name, value in row_entries(packed).items():
+            tables[name][packed] = value
+    return tables
+
+def _table_offsets():
+    offsets = []
+    offset = HEADER.size
+    for name, typecode in TABLE_SPECS:
+        itemsize = array(typecode).itemsize
+        offset = -(-offset // itemsize) * itemsize # align to item size
+        offsets.append((name, typecode, offset, ROW_COUNT * itemsize))
+        offset += ROW_COUNT * itemsize
+    return offsets, offset
+
+def write_tables(tables, path = TABLE_PATH) -> None:
+    """
+    Writes the tables to disk. The file is replaced atomically so concurrent
+        processes never map a partially written file.
+    """
+    offsets, size = _table_offsets()
+    data = bytearray(size)
+    data[:HEADER.size] = HEADER.pack(TABLE_MAGIC, TABLE_VERSION, 1 if sys.byteorder == 'little' else 0)
+    for name, typecode, offset, length in offsets:
+        data[offset:offset + length] = tables[name].tobytes()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def map_tables(path = TABLE_PATH) -> dict:
+    """
+    Memory-maps tables written by write_tables. Returns None if the file
+        is missing or was written by a different version or byte order.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    offsets, size = _table_offsets()
+    if len(mapped) != size or HEADER.unpack_from(mapped) != (TABLE_MAGIC, TABLE_VERSION, 1 if sys.byteorder == 'little' else 0):
+        mapped.close()
+        return None
+    view = memoryview(mapped)
+    return {name: view[offset:offset + length].cast(typecode) for name, typecode, offset, length in offsets}
+
+class LazyRowTable(dict):
+    """
+    Table that computes rows the first time they are looked up.
+    """
+    def __init__(self, name) -> None:
+        super().__init__()
+        self.name = name
+
+    def __missing__(self, packed):
+        value = self[packed] = row_entries(packed)[self.name]
+        return value
+
+class RowTables():
+    """
+    Row lookup tables indexed by packed row, loaded on first attribute access.
+        By default the tables are memory-mapped from a file next to this module,
+        building and writing it first if needed. In lazy mode (or with the
+        ROW_TABLES_LAZY environment variable set) nothing is built up front and
+        rows are computed as they are first seen.
+    """
+    def __init__(self, path = TABLE_PATH, lazy = bool(os.environ.get('ROW_TABLES_LAZY'))) -> None:
+        self.path = path
+        self.lazy = lazy
+
+    def configure(self, path = None, lazy = None) -> None:
+        """
+        Changes where and how the tables are loaded, dropping any loaded tables.
+        """
+        for name, typecode in TABLE_SPECS:
+            self.__dict__.pop(name, None)
+        if path is not None: self.path = path
+        if lazy is not None: self.lazy = lazy
+
+    def load(self) -> None:
+        if self.lazy:
+            tables = {name: LazyRowTable(name) for name, typecode in TABLE_SPECS}
+        else:
+            tables = map_tables(self.path)
+            if tables is None:
+                tables = build_tables()
+                try:
+                    write_tables(tables, self.path)
+                except OSError:
+                    pass # keep the in-memory tables
+                else:
+                    tables = map_tables(self.path) or tables
+        self.__dict__.update(tables)
+
+    def __getattr__(self, name):
+        # only called for attributes that are not loaded yet
+        if name not in dict(TABLE_SPECS):
+            raise AttributeError(name)
+        self.load()
+        return self.__dict__[name]
+
+row_tables = RowTables()
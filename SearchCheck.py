@@ -0,0 +1,89 @@
+"""
+Checks that the expectimax search options behave as documented, run on boards
+sampled by Benchmark.board_corpus so every run checks the same positions:
+
+    python3 SearchCheck.py
+    python3 SearchCheck.py pruning --depths 3 4 5
+    python3 SearchCheck.py time_limit
+
+Every failure is printed, and any failure makes the run exit with status 1.
+"""
+import argparse
+import sys
+from GameBoard import GameBoard
+from Benchmark import BOARDS, SEARCH_AGENTS, board_corpus
+
+CHECKS = ('pruning', 'time_limit')
+PRUNING_AGENTS = ('ExpectimaxAgent', 'CornersExpectimaxAgent')
+PRUNING_OPTIONS = ({}, {'cache_size': 10000}, {'cache_size': 10000, 'canonical_cache': True}, {'prob_cutoff': 0.01})
+TIME_LIMIT_OPTIONS = ({}, {'cache_size': 10000}, {'pruning': True}, {'batch_evaluation': True})
+
+def pruning_check(boards, depths):
+    """
+    Yields a description of every board on which the pruned search picks a
+        different move than the full search, for each agent that can prune,
+        each board backend and each cache option.
+    """
+    import ExpectimaxAgent
+    for backend, board_class in BOARDS.items():
+        corpus = boards if board_class is GameBoard else [board_class.from_board(board) for board in boards]
+        for name in PRUNING_AGENTS:
+            agent_class = getattr(ExpectimaxAgent, name)
+            for depth in depths:
+                for options in PRUNING_OPTIONS:
+                    plain = agent_class(depth, **options)
+                    pruned = agent_class(depth, pruning=True, **options)
+                    for i, board in enumerate(corpus):
+                        move, pruned_move = plain.get_move(board), pruned.get_move(board)
+                        if move != pruned_move:
+                            yield f"{backend} {name}(depth={depth}, {options}) board {i}: {move} without pruning, {pruned_move} with it"
+
+def time_limit_check(boards, time_limit = 1e-4, max_depth = 6):
+    """
+    Yields a description of every board on which a search with a time_limit
+        too short for even one depth returns no move, for each search agent,
+        each board backend and each search option.
+    """
+    import ExpectimaxAgent
+    for backend, board_class in BOARDS.items():
+        corpus = boards if board_class is GameBoard else [board_class.from_board(board) for board in boards]
+        for name in SEARCH_AGENTS:
+            for options in TIME_LIMIT_OPTIONS:
+                agent = getattr(ExpectimaxAgent, name)(max_depth, time_limit=time_limit, **options)
+                for i, board in enumerate(corpus):
+                    if agent.get_move(board) is None:
+                        yield f"{backend} {name}(time_limit={time_limit}, {options}) board {i}: no move"
+
+def run_checks(seed = 2048, boards = 40, depths = (2, 3, 4), checks = CHECKS) -> int:
+    """
+    Runs the selected checks, printing each failure, and returns the number of failures.
+    """
+    corpus = board_corpus(seed, boards * 20)[::20]
+    failures = 0
+    for check in checks:
+        if check == 'pruning':
+            results = pruning_check(corpus, depths)
+        elif check == 'time_limit':
+            results = time_limit_check(corpus)
+        count = 0
+        for failure in results:
+            print(failure, flush=True)
+            count += 1
+        print(f"{check}: {'ok' if count == 0 else f'{count} failure(s)'}", flush=True)
+        failures += count
+    return failures
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Check the 2048 expectimax search options.")
+    parser.add_argument('checks', nargs='*', metavar='CHECK', help=f"checks to run: {', '.join(CHECKS)} (default: all)")
+    parser.add_argument('--seed', type=int, default=2048, help="seed for the board corpus")
+    parser.add_argument('--boards', type=int, default=40, help="corpus boards to check")
+    parser.add_argument('--depths', type=int, nargs='+', default=[2, 3, 4], help="expectimax depths")
+    args = parser.parse_args(argv)
+    for check in args.checks:
+        if check not in CHECKS:
+            parser.error(f"unknown check {check!r}")
+    return 1 if run_checks(args.seed, args.boards, args.depths, args.checks or CHECKS) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
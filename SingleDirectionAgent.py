@@ -1,5 +1,5 @@
 import random
-from GameAgent import GameAgent, play_n_times
+from GameAgent import GameAgent
 
 # Agent that moves in a set direction each turn, when possible.
 class SingleDirectionAgent(GameAgent):
@@ -8,6 +8,3 @@ class SingleDirectionAgent(GameAgent):
       return "down"
     else:
       return random.choice(board.get_legal_moves())
-      
-
-play_n_times(SingleDirectionAgent(), 1000)
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+The 8 symmetries of a packed board (cell (row, col) at bits 4 * (4 * row + col)).
+A transform is a number from 0 to 7 whose bits select a mirror (swap left and
+right), then a flip (swap top and bottom), then a transpose.
+"""
+
+MIRROR = 1
+FLIP = 2
+TRANSPOSE = 4
+
+def transpose(board) -> int:
+    """
+    Returns the packed board with rows and columns swapped.
+    """
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+def mirror(board) -> int:
+    """
+    Returns the packed board with every row reversed.
+    """
+    board = ((board & 0x0F0F0F0F0F0F0F0F) << 4) | ((board >> 4) & 0x0F0F0F0F0F0F0F0F)
+    return ((board & 0x00FF00FF00FF00FF) << 8) | ((board >> 8) & 0x00FF00FF00FF00FF)
+
+def flip(board) -> int:
+    """
+    Returns the packed board with the order of the rows reversed.
+    """
+    board = ((board & 0x0000FFFF0000FFFF) << 16) | ((board >> 16) & 0x0000FFFF0000FFFF)
+    return ((board & 0x00000000FFFFFFFF) << 32) | (board >> 32)
+
+def transform(board, symmetry) -> int:
+    if symmetry & MIRROR: board = mirror(board)
+    if symmetry & FLIP: board = flip(board)
+    if symmetry & TRANSPOSE: board = transpose(board)
+    return board
+
+def symmetries(board) -> list:
+    """
+    Returns the board under each transform, indexed by transform.
+    """
+    mirrored = mirror(board)
+    flipped = flip(board)
+    both = flip(mirrored)
+    return [board, mirrored, flipped, both, transpose(board), transpose(mirrored), transpose(flipped), transpose(both)]
+
+def canonical_form(board) -> tuple[int, int]:
+    """
+    Returns the smallest of the board's symmetric forms and the transform giving it.
+    """
+    forms = symmetries(board)
+    key = min(forms)
+    return (key, forms.index(key))
+
+# how each transform step relabels a move direction
+MIRROR_ACTIONS = {'up': 'up', 'down': 'down', 'left': 'right', 'right': 'left'}
+FLIP_ACTIONS = {'up': 'down', 'down': 'up', 'left': 'left', 'right': 'right'}
+TRANSPOSE_ACTIONS = {'up': 'left', 'down': 'right', 'left': 'up', 'right': 'down'}
+
+def transform_action(action, symmetry) -> str:
+    """
+    Returns the move on the transformed board matching the given move on the original.
+    """
+    if symmetry & MIRROR: action = MIRROR_ACTIONS[action]
+    if symmetry & FLIP: action = FLIP_ACTIONS[action]
+    if symmetry & TRANSPOSE: action = TRANSPOSE_ACTIONS[action]
+    return action
+
+def untransform_action(action, symmetry) -> str:
+    """
+    Returns the move on the original board matching the given move on the transformed one.
+    """
+    if symmetry & TRANSPOSE: action = TRANSPOSE_ACTIONS[action]
+    if symmetry & FLIP: action = FLIP_ACTIONS[action]
+    if symmetry & MIRROR: action = MIRROR_ACTIONS[action]
+    return action
@@ -0,0 +1,45 @@
+from collections import OrderedDict
+
+class TranspositionTable():
+    """
+    Bounded cache of search values with least-recently-used eviction.
+    Keeps hit and miss counts for reporting.
+    """
+    def __init__(self, max_entries = 100000) -> None:
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Returns the value stored for the key, or None if it is not cached.
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return f"TranspositionTable({len(self.entries)}/{self.max_entries} entries, {self.hits} hits, {self.misses} misses, {self.hit_rate():.1%} hit rate)"
@@ -1,8 +1,98 @@
-from GameAgent import play_with_agent
-from UserAgent import UserAgent
+import argparse
+import ast
+import importlib
+from GameAgent import play_with_agent, play_n_times
+from GameBoard import GameBoard
+from BitBoard import BitBoard
+from GameRecord import GameRecorder
+
+# name -> (module, class, default parameters)
+AGENTS = {
+    'user': ('UserAgent', 'UserAgent', {}),
+    'random': ('RandomAgent', 'RandomAgent', {}),
+    'down': ('SingleDirectionAgent', 'SingleDirectionAgent', {}),
+    'left-down': ('LeftDownAgent', 'LeftDownAgent', {}),
+    'expectimax': ('ExpectimaxAgent', 'ExpectimaxAgent', {}),
+    'corners': ('ExpectimaxAgent', 'CornersExpectimaxAgent', {}),
+    'smooth-empty-corners': ('ExpectimaxAgent', 'SmoothEmptyCornersExpectimaxAgent', {}),
+    'qlearning': ('QLearningAgent', 'QLearningAgent', {'learning_rate': 0.1, 'discount': 0.9, 'epsilon': 0.1}),
+    'approximate': ('QLearningAgent', 'ApproximateQLearningAgent', {'learning_rate': 0.0001, 'discount': 0.9, 'epsilon': 0.9}),
+    'ntuple': ('QLearningAgent', 'NTupleQLearningAgent', {}),
+}
+
+BOARDS = {'list': GameBoard, 'bit': BitBoard}
+
+def make_agent(name, params = {}):
+    """
+    Imports and constructs the named agent, with params overriding its defaults.
+    """
+    module, cls, defaults = AGENTS[name]
+    return getattr(importlib.import_module(module), cls)(**{**defaults, **params})
+
+def parse_param(text):
+    """
+    Parses NAME=VALUE, reading VALUE as a Python literal when it is one.
+    """
+    name, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return (name.replace('-', '_'), value)
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description="Play 2048 yourself or with an AI agent.")
+    parser.add_argument('agent', nargs='?', default='user', choices=AGENTS, help="agent to play with (default: user, an interactive game)")
+    parser.add_argument('-p', '--param', action='append', type=parse_param, default=[], metavar='NAME=VALUE',
+        help="agent constructor parameter, e.g. -p max_depth=4 (repeatable)")
+    parser.add_argument('-n', '--games', type=int, default=100, help="number of games to play (default: 100)")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="processes to play games in (default: 1)")
+    parser.add_argument('-s', '--seed', type=int, help="seed making the games repeatable")
+    parser.add_argument('-b', '--board', choices=BOARDS, default='list', help="board backend (default: list)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="report every game")
+    parser.add_argument('--show', action='store_true', help="play one game, printing the board after every move")
+    parser.add_argument('--record', metavar='FILE', help="append a record of every game to FILE (see GameRecord)")
+    training = parser.add_argument_group('learning agents')
+    training.add_argument('--train', type=int, default=0, metavar='EPISODES', help="episodes to train before playing")
+    training.add_argument('--train-workers', type=int, default=1, help="processes generating training episodes")
+    training.add_argument('--sync-interval', type=int, default=10, help="episodes between weight snapshots for training workers")
+    training.add_argument('--checkpoint-dir', help="directory to checkpoint training in and resume it from")
+    training.add_argument('--checkpoint-every', type=int, default=100, help="episodes between checkpoints")
+    training.add_argument('--load', metavar='DIR', help="directory of a saved model to start from")
+    args = parser.parse_args(argv)
+    learning = args.agent in ('qlearning', 'approximate', 'ntuple')
+    if not learning and (args.train or args.load or args.checkpoint_dir):
+        parser.error(f"{args.agent} is not a learning agent")
+    return args
 
 def play_game():
-    play_with_agent(UserAgent())
+    play_with_agent(make_agent('user'))
+
+def main(argv = None):
+    args = parse_args(argv)
+    if args.agent == 'user':
+        play_game()
+        return
+    agent = make_agent(args.agent, dict(args.param))
+    board_class = BOARDS[args.board]
+    try:
+        if args.load:
+            agent.load(args.load)
+        if args.train or args.checkpoint_dir:
+            agent.train_n_times(args.train, args.checkpoint_dir, args.checkpoint_every,
+                args.train_workers, args.sync_interval, args.seed)
+        if args.show:
+            play_with_agent(agent, board_class=board_class)
+        elif args.games > 0 and args.record:
+            with GameRecorder(args.record) as recorder:
+                play_n_times(agent, args.games, args.verbose, board_class, args.workers, args.seed, recorder)
+        elif args.games > 0:
+            play_n_times(agent, args.games, args.verbose, board_class, args.workers, args.seed)
+    finally:
+        if hasattr(agent, 'close'):
+            agent.close()
 
 if __name__ == "__main__":
-    play_game()
\ No newline at end of file
+    main()